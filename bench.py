@@ -0,0 +1,507 @@
+import os
+import sys
+import csv
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+import pandas as pd
+from datetime import date, datetime, timedelta
+from tqc import make_query_params, results_dataframe, column_aliases, returned_get_columns, required_add_columns, write_rows
+from mock_tqc import synthetic_records, serve
+
+
+def metric_directions():
+    '''
+    Measurements made by the benchmarks, and whether lower or higher values are better.
+
+    Every other field of a benchmark's results identifies what was measured.
+    '''
+    return {
+        'params' : 'lower',
+        'url_bytes' : 'lower',
+        'build_ms' : 'lower',
+        'build_s' : 'lower',
+        'peak_mb' : 'lower',
+        'frame_mb' : 'lower',
+        'median_ms' : 'lower',
+        'wall_s' : 'lower',
+        'rows_per_s' : 'higher',
+    }
+
+
+def time_call(func, repeats):
+    '''
+    Median wall-clock time of `repeats` calls to `func`, in milliseconds.
+    '''
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def peak_memory_wrapper():
+    '''
+    Code that runs the script given as its first argument, then writes the peak resident memory of the process (in MB) to `$TQC_BENCH_PEAK`.
+
+    The peak is read from the process itself, as the `ru_maxrss` of a child also counts the memory of the benchmark that started it.
+    '''
+    return '\n'.join([
+        'import os, sys, atexit, runpy',
+        'def write_peak():',
+        '    peak = None',
+        '    if os.path.isfile("/proc/self/status"):',
+        '        with open("/proc/self/status") as status:',
+        '            peak = next(int(line.split()[1]) / 1e3 for line in status if line.startswith("VmHWM:"))',
+        '    else:',
+        '        import resource',
+        '        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e6',
+        '    with open(os.environ["TQC_BENCH_PEAK"], "w") as f:',
+        '        f.write(str(peak))',
+        'atexit.register(write_peak)',
+        'sys.argv = sys.argv[1:]',
+        'runpy.run_path(sys.argv[0], run_name="__main__")',
+    ])
+
+
+def run_child(args, env=None, cwd=None):
+    '''
+    Run `python` with `args` (a script and its arguments), returning its wall-clock time in seconds and its peak resident memory in MB.
+    '''
+    with tempfile.NamedTemporaryFile('r') as peak:
+        env = dict(env or os.environ, TQC_BENCH_PEAK=peak.name)
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, '-c', peak_memory_wrapper()] + args, env=env, cwd=cwd, stdout=subprocess.DEVNULL)
+        wall_s = time.perf_counter() - start
+        if process.returncode != 0:
+            raise Exception(f'{" ".join(args)} exited with status {process.returncode}')
+        peak_mb = float(peak.read())
+    return wall_s, peak_mb
+
+
+def client_env(tmp):
+    '''
+    Environment for running the client, with its failures log, index and cache kept out of the way in `tmp`.
+    '''
+    env = dict(os.environ, EAGLEOWL_SCRATCH=tmp, TQC_CACHE_DIR=tmp)
+    os.makedirs(f'{tmp}/tqc', exist_ok=True)
+    # Write bytecode for tqc.py, as it would be after its first run
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def client_dir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def write_upload_tsv(path, n):
+    '''
+    Write `n` synthetic records to `path`, as a TSV ready for `tqc.py add`.
+    '''
+    with open(path, 'w') as tsv:
+        write_rows(synthetic_records(n), tsv)
+
+
+def bench_query_params(repeats=100):
+    '''
+    URL size and build time of `make_query_params` for date ranges spanning days, months and years.
+    '''
+    spans = {
+        '1 day' : 1,
+        '1 week' : 7,
+        '1 month' : 31,
+        '6 months' : 183,
+        '1 year' : 365,
+        '3 years' : 3 * 365,
+    }
+    start_date = date(2022, 3, 2)
+    url = 'http://localhost:8000/get/?'
+
+    results = []
+    for span, days in spans.items():
+        end_date = start_date + timedelta(days=days - 1)
+        for ranges in [False, True]:
+            # make_query_params modifies its arguments, so each call is given a fresh copy
+            make_args = lambda: {'published_date_range' : [str(start_date), str(end_date)]}
+            params = make_query_params(make_args(), ranges=ranges)
+            build_ms = time_call(lambda: make_query_params(make_args(), ranges=ranges), repeats)
+            results.append({
+                'span' : span,
+                'mode' : 'ranges' if ranges else 'expanded',
+                'params' : params.count('&') + 1,
+                'url_bytes' : len(url + params),
+                'build_ms' : round(build_ms, 4),
+            })
+    return results
+
+
+def normalized_dataframe(results):
+    '''
+    The TQC output table as it was built before `results_dataframe`, with `pd.json_normalize`.
+    '''
+    df = pd.json_normalize(results)
+    df = df.drop('id', axis=1)
+    df = df.rename(columns=column_aliases('get'))
+    return df[returned_get_columns()]
+
+
+def bench_build(sizes):
+    '''
+    Build time, peak allocation and final size of the TQC output table, built with `pd.json_normalize` and with `results_dataframe`.
+    '''
+    results = []
+    for size in sizes:
+        records = list(synthetic_records(size))
+        for builder, build in [('json_normalize', normalized_dataframe), ('typed', results_dataframe)]:
+            tracemalloc.start()
+            start = time.perf_counter()
+            df = build(records)
+            build_s = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append({
+                'rows' : size,
+                'builder' : builder,
+                'build_s' : round(build_s, 3),
+                'peak_mb' : round(peak / 1e6, 1),
+                'frame_mb' : round(df.memory_usage(deep=True).sum() / 1e6, 1),
+            })
+            del df
+    return results
+
+
+def startup_commands(url_args, tsv_path, central_sample_id):
+    '''
+    Commands timed by `bench_startup`, with the modules each of them must not import.
+    '''
+    return {
+        'import' : (['-c', 'import tqc'], ['requests', 'numpy', 'pandas']),
+        'help' : (['tqc.py', '--help'], ['requests', 'numpy', 'pandas']),
+        'help (-m)' : (['-m', 'tqc', '--help'], ['requests', 'numpy', 'pandas']),
+        'add' : (['tqc.py', 'add', tsv_path, '--hide-uploads', '--journal', tsv_path + '.journal'] + url_args, ['numpy', 'pandas']),
+        'get' : (['tqc.py', 'get', '--no-cache', '--all', '--central-sample-id', central_sample_id] + url_args, ['numpy', 'pandas']),
+    }
+
+
+def imported_modules(args, env, cwd):
+    '''
+    Top-level modules imported by running `python` with `args`, from the output of `-X importtime`.
+    '''
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + args, env=env, cwd=cwd, capture_output=True, text=True)
+    modules = set()
+    for line in process.stderr.splitlines():
+        if line.startswith('import time:') and line.count('|') == 2:
+            modules.add(line.rsplit('|', 1)[1].strip().split('.')[0])
+    return modules
+
+
+def bench_startup(repeats=10):
+    '''
+    Median wall-clock time to start the client and run small add and get requests against a mock server,
+    and any modules each command imports that it does not need.
+    '''
+    server = serve(rows=100)
+    url_args = ['--host', '127.0.0.1', '--port', str(server.server_port)]
+    records = list(synthetic_records(10))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tsv_path = os.path.join(tmp, 'upload.tsv')
+        with open(tsv_path, 'w') as tsv:
+            writer = csv.writer(tsv, delimiter='\t', lineterminator='\n')
+            writer.writerow(required_add_columns())
+            for record in records:
+                writer.writerow([record[x] for x in required_add_columns()])
+
+        env = client_env(tmp)
+        cwd = client_dir()
+        subprocess.run([sys.executable, '-c', 'import tqc'], env=env, cwd=cwd, check=True)
+
+        for name, (args, unneeded) in startup_commands(url_args, tsv_path, records[0]['central_sample_id']).items():
+            imported = sorted(imported_modules(args, env, cwd) & set(unneeded))
+            median_ms = time_call(lambda: subprocess.run([sys.executable] + args, env=env, cwd=cwd, stdout=subprocess.DEVNULL, check=True), repeats)
+            results.append({
+                'command' : name,
+                'median_ms' : round(median_ms, 1),
+                'unneeded_imports' : ','.join(imported) or '-',
+            })
+
+    server.shutdown()
+    server.server_close()
+    return results
+
+
+def run_children(make_args, repeats, env=None, cwd=None):
+    '''
+    Median wall-clock time and highest peak memory of `repeats` runs of `python` with the arguments returned by `make_args()`.
+    '''
+    runs = [run_child(make_args(), env=env, cwd=cwd) for _ in range(repeats)]
+    return statistics.median(wall_s for wall_s, _ in runs), max(peak_mb for _, peak_mb in runs)
+
+
+def bench_add(size=10000, workers=[1, 8], batch_sizes=[1, 100], latency=0.0, repeats=1):
+    '''
+    Throughput and peak memory of `tqc.py add` uploading `size` synthetic records to a mock server,
+    over each number of `workers` and each of `batch_sizes`.
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tsv_path = os.path.join(tmp, 'upload.tsv')
+        write_upload_tsv(tsv_path, size)
+        env = client_env(tmp)
+
+        for n in workers:
+            for batch_size in batch_sizes:
+                servers = []
+
+                def make_args():
+                    # A new server for each run, so that every record is new to it
+                    servers.append(serve(latency=latency))
+                    return [
+                        'tqc.py', 'add', tsv_path,
+                        '--hide-uploads',
+                        '--workers', str(n),
+                        '--batch-size', str(batch_size),
+                        '--journal', os.path.join(tmp, 'journal'),
+                        '--host', '127.0.0.1',
+                        '--port', str(servers[-1].server_port)
+                    ]
+
+                wall_s, peak_mb = run_children(make_args, repeats, env=env, cwd=client_dir())
+                for server in servers:
+                    uploaded = len(server.records)
+                    server.shutdown()
+                    server.server_close()
+                    if uploaded != size:
+                        raise Exception(f'Mock server received {uploaded} of {size} records')
+
+                results.append({
+                    'rows' : size,
+                    'workers' : n,
+                    'batch_size' : batch_size,
+                    'wall_s' : round(wall_s, 3),
+                    'rows_per_s' : round(size / wall_s, 1),
+                    'peak_mb' : round(peak_mb, 1),
+                })
+    return results
+
+
+def get_modes():
+    '''
+    Ways of running `tqc.py get` measured by `bench_get`.
+    '''
+    return {
+        'table' : [],
+        'paged' : ['--page-size', '10000'],
+        'stream' : ['--stream'],
+        'paged-stream' : ['--stream', '--page-size', '10000'],
+    }
+
+
+def bench_get(sizes, modes=None, latency=0.0, repeats=3):
+    '''
+    End-to-end wall-clock time and peak memory of `tqc.py get` for all of `sizes` synthetic records on a mock server, in each of `modes`.
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = client_env(tmp)
+
+        for size in sizes:
+            server = serve(rows=size, latency=latency)
+            for mode in modes or get_modes():
+                args = [
+                    'tqc.py', 'get',
+                    '--all',
+                    '--no-cache',
+                    '--host', '127.0.0.1',
+                    '--port', str(server.server_port)
+                ] + get_modes()[mode]
+                wall_s, peak_mb = run_children(lambda: args, repeats, env=env, cwd=client_dir())
+
+                results.append({
+                    'rows' : size,
+                    'mode' : mode,
+                    'wall_s' : round(wall_s, 3),
+                    'rows_per_s' : round(size / wall_s, 1),
+                    'peak_mb' : round(peak_mb, 1),
+                })
+            server.shutdown()
+            server.server_close()
+            # The server's records are no longer needed, so are freed before the next size is generated
+            del server
+    return results
+
+
+def print_results(results):
+    if not results:
+        return
+    columns = list(results[0])
+    print('\t'.join(columns))
+    for result in results:
+        print('\t'.join(str(result[x]) for x in columns))
+
+
+def save_results(path, name, results):
+    '''
+    Save the results of benchmark `name` to `path` as a baseline, alongside those of any other benchmarks already saved there.
+    '''
+    baseline = {}
+    if os.path.isfile(path):
+        with open(path) as f:
+            baseline = json.load(f)
+
+    baseline[name] = {
+        'saved' : datetime.today().strftime('%Y-%m-%d %H:%M:%S'),
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+        'results' : results,
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=4)
+        f.write('\n')
+
+
+def compare_results(path, name, results, tolerance=0.25):
+    '''
+    Compare the results of benchmark `name` with its baseline in `path`, printing any change in each measurement.
+
+    Returns `False` if any measurement is worse than its baseline by more than `tolerance` (a fraction of the baseline).
+    '''
+    with open(path) as f:
+        baseline = json.load(f)
+
+    if not (name in baseline):
+        raise Exception(f"No baseline for '{name}' in '{path}'")
+
+    directions = metric_directions()
+
+    def key(result):
+        return tuple((x, result[x]) for x in result if not (x in directions))
+
+    previous = {key(result) : result for result in baseline[name]['results']}
+
+    ok = True
+    print('[COMPARISON]')
+    print(f'Baseline: {path} ({baseline[name]["saved"]})')
+    print('\t'.join(['case', 'metric', 'baseline', 'current', 'change', 'status']))
+    for result in results:
+        before = previous.get(key(result))
+        case = ', '.join(f'{x}={value}' for x, value in key(result))
+        if before is None:
+            print('\t'.join([case, '-', '-', '-', '-', 'new']))
+            continue
+
+        for metric, direction in directions.items():
+            if not (metric in result and metric in before):
+                continue
+            old, new = before[metric], result[metric]
+            change = (new - old) / old if old else 0.0
+            worse = change > tolerance if direction == 'lower' else change < -tolerance
+            if worse:
+                ok = False
+            print('\t'.join([case, metric, str(old), str(new), f'{change:+.1%}', 'REGRESSION' if worse else 'ok']))
+    return ok
+
+
+def run_benchmark(name, args):
+    '''
+    Run benchmark `name` with its command line arguments, returning its results.
+    '''
+    if name == 'query-params':
+        return bench_query_params(repeats=args.repeats)
+    elif name == 'build':
+        return bench_build(args.sizes)
+    elif name == 'startup':
+        return bench_startup(repeats=args.repeats)
+    elif name == 'add':
+        return bench_add(size=args.size, workers=args.workers, batch_sizes=args.batch_sizes, latency=args.latency, repeats=args.repeats)
+    elif name == 'get':
+        return bench_get(args.sizes, modes=args.modes, latency=args.latency, repeats=args.repeats)
+
+
+def suite_benchmarks():
+    '''
+    Benchmarks run by the suite, with the arguments each is run with.
+    '''
+    return {
+        'query-params' : {'repeats' : 100},
+        'build' : {'sizes' : [10000, 100000]},
+        'startup' : {'repeats' : 10},
+        'add' : {'size' : 10000, 'workers' : [1, 8], 'batch_sizes' : [1, 100], 'latency' : 0.0, 'repeats' : 1},
+        'get' : {'sizes' : [10000, 100000], 'modes' : None, 'latency' : 0.0, 'repeats' : 3},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for the TQC client')
+    benchmarks = parser.add_subparsers(dest='benchmark', required=True)
+
+    query_params_parser = benchmarks.add_parser('query-params', description='URL size and build time of make_query_params over long date ranges')
+    query_params_parser.add_argument('--repeats', default=100, type=int)
+
+    build_parser = benchmarks.add_parser('build', description='Build time and memory of the TQC output table, before and after typed construction')
+    build_parser.add_argument('--sizes', nargs='+', default=[10000, 100000, 1000000], type=int, metavar=('N'))
+
+    startup_parser = benchmarks.add_parser('startup', description='Start-up time of the client, failing if a command imports a module it does not need')
+    startup_parser.add_argument('--repeats', default=10, type=int)
+    startup_parser.add_argument('--max-ms', default=None, type=float, metavar=('MS'), help='Also fail if any command takes longer than MS')
+
+    add_parser = benchmarks.add_parser('add', description='Throughput of tqc.py add against a mock server')
+    add_parser.add_argument('--size', default=10000, type=int, metavar=('N'), help='Number of records uploaded. Default: 10000')
+    add_parser.add_argument('--workers', nargs='+', default=[1, 8], type=int, metavar=('N'))
+    add_parser.add_argument('--batch-sizes', nargs='+', default=[1, 100], type=int, metavar=('N'))
+    add_parser.add_argument('--latency', default=0.0, type=float, metavar=('SECONDS'), help='Delay added by the mock server to every response')
+    add_parser.add_argument('--repeats', default=1, type=int, help='Runs of each case, of which the median time is taken. Default: 1')
+
+    get_parser = benchmarks.add_parser('get', description='End-to-end time and peak memory of tqc.py get against a mock server')
+    get_parser.add_argument('--sizes', nargs='+', default=[10000, 100000], type=int, metavar=('N'))
+    get_parser.add_argument('--modes', nargs='+', default=None, choices=list(get_modes()), help='Default: all of them')
+    get_parser.add_argument('--latency', default=0.0, type=float, metavar=('SECONDS'), help='Delay added by the mock server to every response')
+    get_parser.add_argument('--repeats', default=3, type=int, help='Runs of each case, of which the median time is taken. Default: 3')
+
+    suite_parser = benchmarks.add_parser('suite', description='Run every benchmark, at sizes small enough to run routinely')
+
+    for p in [query_params_parser, build_parser, startup_parser, add_parser, get_parser, suite_parser]:
+        p.add_argument('--save', default=None, metavar=('PATH'), help='Save the results to PATH as a baseline')
+        p.add_argument('--compare', default=None, metavar=('PATH'), help='Compare the results with the baseline in PATH, failing if any are worse')
+        p.add_argument('--tolerance', default=0.25, type=float, metavar=('FRACTION'), help='How much worse than the baseline a result can be. Default: 0.25')
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'suite':
+        runs = [(name, argparse.Namespace(**arguments)) for name, arguments in suite_benchmarks().items()]
+    else:
+        runs = [(args.benchmark, args)]
+
+    ok = True
+    for name, arguments in runs:
+        if len(runs) > 1:
+            print(f'[{name.upper()}]')
+        results = run_benchmark(name, arguments)
+        print_results(results)
+
+        # Importing a module that a command does not need is always a failure
+        if name == 'startup':
+            for result in results:
+                if result['unneeded_imports'] != '-':
+                    ok = False
+                if getattr(arguments, 'max_ms', None) is not None and result['median_ms'] > arguments.max_ms:
+                    ok = False
+
+        if args.compare:
+            ok = compare_results(args.compare, name, results, tolerance=args.tolerance) and ok
+        if args.save:
+            save_results(args.save, name, results)
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
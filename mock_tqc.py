@@ -0,0 +1,459 @@
+import sys
+import json
+import math
+import gzip
+import time
+import random
+import hashlib
+import statistics
+import argparse
+import threading
+from datetime import date, timedelta
+from urllib.parse import urlsplit, parse_qsl
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from tqc import required_add_columns, returned_get_columns, numeric_columns, integer_columns, date_columns, column_aliases
+
+
+def tile_counts():
+    '''
+    Number of tiles in each of the primer schemes used for synthetic records.
+    '''
+    return {
+        '3' : 98,
+        '4' : 99,
+        '4.1' : 99,
+    }
+
+
+def synthetic_records(n, seed=0):
+    '''
+    Generate `n` records shaped like those returned by TQC, published over the year from 2022-03-02.
+    '''
+    rng = random.Random(seed)
+    orgs = ['BIRM', 'CAMB', 'EDIN', 'LOND', 'NORT', 'OXON', 'PHEC', 'SANG']
+    pillars = ['1', '2']
+    schemes = list(tile_counts()) + ['']
+    start = date(2022, 3, 2)
+    # Field names as stored by the server, rather than as displayed by the client
+    fields = [column_aliases('add').get(x, x) for x in returned_get_columns()]
+
+    for i in range(n):
+        published = start + timedelta(days=i * 365 // max(n, 1))
+        collected = published - timedelta(days=rng.randint(3, 14))
+        received = collected + timedelta(days=rng.randint(1, 2))
+        org = rng.choice(orgs)
+        scheme = rng.choice(schemes)
+        central_sample_id = f'{org}-{i:07d}'
+        run_name = f'{published:%y%m%d}_{org}_{i // 96:05d}'
+
+        record = {x : '' for x in fields}
+        record.update({
+            'id' : i + 1,
+            'central_sample_id' : central_sample_id,
+            'run_name' : run_name,
+            'pag_name' : f'{org}/{central_sample_id}:{run_name}',
+            'sequencing_org_code' : org,
+            'foel_producer' : rng.choice(['', 'FOEL1', 'FOEL2']),
+            'phe_private_provider' : rng.choice(['', 'PP1', 'PP2']),
+            'phe_site' : rng.choice(['', 'SITE1', 'SITE2', 'SITE3']),
+            'collection_pillar' : rng.choice(pillars),
+            'collection_date' : str(collected),
+            'received_date' : str(received),
+            'sequencing_org_received_date' : str(received),
+            'sequencing_submission_date' : str(published - timedelta(days=1)),
+            'published_date' : str(published),
+            'fasta_path' : f'/cephfs/covid/bham/{org}/upload/{central_sample_id}.fasta',
+            'bam_path' : f'/cephfs/covid/bham/{org}/upload/{central_sample_id}.bam',
+            'library_primers' : scheme,
+            'library_primers_reported' : f'ARTIC v{scheme}' if scheme else '',
+            'pag_suppressed' : 'SUPPRESSED' if rng.random() < 0.01 else 'VALID',
+            'pag_basic_qc' : 'FAIL' if rng.random() < 0.05 else 'PASS',
+        })
+
+        # Fasta QC
+        num_bases = rng.randint(29000, 30000)
+        pc_masked = round(rng.betavariate(1, 12) * 100, 2)
+        pc_ambiguous = round(rng.random() * 0.1, 2)
+        record.update({
+            'num_bases' : num_bases,
+            'pc_acgt' : round(100 - pc_masked - pc_ambiguous, 2),
+            'pc_masked' : pc_masked,
+            'pc_ambiguous' : pc_ambiguous,
+            'pc_invalid' : 0.0,
+            'longest_gap' : int(num_bases * pc_masked / 100),
+            'longest_ungap' : int(num_bases * (1 - pc_masked / 100)),
+        })
+
+        # Bam QC
+        mean_cov = round(rng.lognormvariate(7, 0.6), 2)
+        record['num_pos'] = 29903
+        record['mean_cov'] = mean_cov
+        for x in [1, 5, 10, 20, 50, 100, 200]:
+            record[f'pc_pos_cov_gte{x}'] = round(max(0.0, 100 - pc_masked - x * 100 / mean_cov / 10), 2)
+
+        # Tile QC, for records whose primers map to a scheme
+        if scheme:
+            dropout = rng.random() * 0.1
+            tiles = [0 if rng.random() < dropout else int(rng.lognormvariate(7, 0.8)) for _ in range(tile_counts()[scheme])]
+            for x in [1, 5, 10, 20, 50, 100, 200]:
+                record[f'pc_tiles_medcov_gte{x}'] = round(100 * sum(tile >= x for tile in tiles) / len(tiles), 2)
+            record['tile_n'] = len(tiles)
+            record['tile_vector'] = str(tiles)
+        else:
+            for x in [1, 5, 10, 20, 50, 100, 200]:
+                record[f'pc_tiles_medcov_gte{x}'] = None
+            record['tile_n'] = None
+            record['tile_vector'] = ''
+
+        yield record
+
+
+def compare(cell, operator, num):
+    if operator == 'lt':
+        return cell < num
+    elif operator == 'gt':
+        return cell > num
+    elif operator == 'leq':
+        return cell <= num
+    elif operator == 'geq':
+        return cell >= num
+    elif operator == 'eq':
+        return cell == num
+    elif operator == 'neq':
+        return cell != num
+    else:
+        raise Exception(f"'{operator}' is not an operator")
+
+
+def matches(record, filters):
+    '''
+    Whether a record satisfies the filters of a get request, in the same way as the TQC server.
+
+    Values for numeric fields are AND'd together, values for all other fields are OR'd together.
+    '''
+    for field, values in filters.items():
+        cell = record.get(field)
+
+        if field in numeric_columns():
+            for value in values:
+                operator, num = value.split('_', 1)
+                if cell is None or not compare(cell, operator.lower(), float(num)):
+                    return False
+        else:
+            cell = '' if cell is None else str(cell)
+            for value in values:
+                if field in date_columns() and value.startswith('range_'):
+                    _, start, end = value.split('_')
+                    if cell and start <= cell <= end:
+                        break
+                elif cell == value:
+                    break
+            else:
+                return False
+    return True
+
+
+def group_value(record, column):
+    '''
+    Value of `column` that a record is grouped by, as a string. ISO week columns are taken from the date they are named after.
+    '''
+    if column.endswith('_iso_week'):
+        cell = record.get(column[:-len('_iso_week')] + '_date')
+        if not cell:
+            return ''
+        year, week, _ = date.fromisoformat(cell).isocalendar()
+        return f'{year}-{week:02d}'
+    cell = record.get(column)
+    return '' if cell is None else str(cell)
+
+
+def percentile(values, q):
+    '''
+    The `q` quantile of sorted `values`, interpolating linearly between the two nearest.
+    '''
+    position = q * (len(values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def aggregate(records, group_by, specs):
+    '''
+    Compute the aggregations in `specs` over groups of `records`, in plain Python.
+
+    This is written independently of the client's own aggregations, so that the two can be checked against each other.
+    '''
+    for column in group_by:
+        if not (column in returned_get_columns() or (column.endswith('_iso_week') and column[:-len('_iso_week')] + '_date' in date_columns())):
+            raise ValueError(f"Cannot group by unknown column '{column}'")
+
+    groups = {}
+    for record in records:
+        groups.setdefault(tuple(group_value(record, x) for x in group_by), []).append(record)
+
+    table = []
+    for key in sorted(groups):
+        group = groups[key]
+        row = dict(zip(group_by, key))
+        for spec in specs:
+            if spec == 'count':
+                row['count'] = len(group)
+                continue
+
+            func, _, column = spec.partition(':')
+            if func == 'rate':
+                column, _, value = column.partition('=')
+                if not (column in returned_get_columns()):
+                    raise ValueError(f"Invalid aggregation '{spec}'")
+                row[f'rate_{column}_{value}'] = round(sum(('' if x.get(column) is None else str(x.get(column))) == value for x in group) / len(group), 4)
+                continue
+
+            if not (column in numeric_columns()):
+                raise ValueError(f"Invalid aggregation '{spec}'")
+            values = sorted(float(x[column]) for x in group if not (x.get(column) is None or x.get(column) == ''))
+
+            if not values or (func == 'std' and len(values) < 2):
+                result = None
+            elif func == 'mean':
+                result = round(statistics.fmean(values), 4)
+            elif func == 'sum':
+                result = round(math.fsum(values), 4)
+            elif func == 'min':
+                result = values[0]
+            elif func == 'max':
+                result = values[-1]
+            elif func == 'std':
+                result = round(statistics.stdev(values), 4)
+            elif func == 'median':
+                result = round(statistics.median(values), 4)
+            elif func.startswith('q') and func[1:].replace('.', '', 1).isdigit() and float(func[1:]) <= 100:
+                result = round(percentile(values, float(func[1:]) / 100), 4)
+            else:
+                raise ValueError(f"Invalid aggregation '{spec}'")
+
+            if result is not None and func in ['sum', 'min', 'max'] and column in integer_columns():
+                result = int(result)
+            row[f'{func}_{column}'] = result
+        table.append(row)
+    return table
+
+
+class MockTQCHandler(BaseHTTPRequestHandler):
+    '''
+    Local stand-in for the TQC server, for trying out the client without CLIMB.
+
+    Uploaded records are kept in memory, keyed by (central_sample_id, run_name, pag_name).
+    Get requests are served from a separate table of synthetic records.
+    '''
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, which stalls keep-alive connections on delayed ACKs otherwise
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, data, etag=False):
+        body = json.dumps(data).encode()
+
+        # Conditional requests are answered without a body if the client already has the same one
+        if etag:
+            tag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == tag:
+                self.send_response(304)
+                self.send_header('ETag', tag)
+                self.end_headers()
+                return
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', tag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return body.decode()
+
+    def store(self, record):
+        '''
+        Store a record, returning the response code that the real server would give for it.
+        '''
+        if not isinstance(record, dict):
+            return 400
+        for x in required_add_columns():
+            if not record.get(x):
+                return 400
+        key = tuple(record[x] for x in required_add_columns())
+        with self.server.lock:
+            self.server.records[key] = record
+        return 201
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urlsplit(self.path)
+
+        if self.server.max_url_length and len(self.path) > self.server.max_url_length:
+            self.send_json(414, {'detail' : 'URI Too Long'})
+
+        elif random.random() < self.server.error_rate:
+            self.send_json(503, {'detail' : 'Service Unavailable'})
+
+        elif url.path == '/capabilities':
+            self.send_json(200, {'range_filters' : self.server.ranges, 'pagination' : self.server.pagination, 'projection' : self.server.projection, 'aggregation' : self.server.aggregation})
+
+        elif url.path in ['/get', '/get/']:
+            filters = {}
+            for field, value in parse_qsl(url.query, keep_blank_values=True):
+                filters.setdefault(field, []).append(value)
+            try:
+                # Results are ordered by id, so that pages are stable
+                limit = int(filters.pop('limit')[0]) if 'limit' in filters else None
+                offset = int(filters.pop('offset', ['0'])[0])
+                fields = filters.pop('fields')[0].split(',') if 'fields' in filters else None
+                results = [record for record in self.server.rows if matches(record, filters)]
+            except Exception as e:
+                self.send_json(400, {'detail' : str(e)})
+                return
+            if limit is not None and self.server.pagination:
+                results = results[offset : offset + limit]
+            if fields is not None and self.server.projection:
+                results = [{x : record.get(x) for x in fields} for record in results]
+            self.send_json(200, results, etag=self.server.etags)
+
+        elif url.path in ['/stats', '/stats/'] and self.server.aggregation:
+            filters = {}
+            for field, value in parse_qsl(url.query, keep_blank_values=True):
+                filters.setdefault(field, []).append(value)
+            try:
+                group_by = filters.pop('group_by')[0].split(',') if 'group_by' in filters else []
+                specs = filters.pop('agg', ['count'])
+                results = [record for record in self.server.rows if matches(record, filters)]
+                table = aggregate(results, group_by, specs)
+            except Exception as e:
+                self.send_json(400, {'detail' : str(e)})
+                return
+            self.send_json(200, table)
+
+        else:
+            self.send_json(404, {'detail' : 'Not Found'})
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+
+        if random.random() < self.server.error_rate:
+            self.read_body()
+            self.send_json(503, {'detail' : 'Service Unavailable'})
+
+        elif self.headers.get('api_key') != self.server.api_key:
+            self.send_json(403, {'detail' : 'Invalid api key'})
+
+        elif self.path == '/add':
+            try:
+                record = json.loads(self.read_body())
+            except json.JSONDecodeError:
+                self.send_json(400, {'detail' : 'Invalid JSON'})
+                return
+            status = self.store(record)
+            self.send_json(status, {})
+
+        elif self.path == '/add/bulk' and self.server.bulk:
+            results = []
+            for line in self.read_body().splitlines():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    results.append({'status' : 400})
+                    continue
+                results.append({'status' : self.store(record)})
+            self.send_json(200, results)
+
+        else:
+            self.read_body()
+            self.send_json(404, {'detail' : 'Not Found'})
+
+
+def publish_records(server, interval):
+    '''
+    Add a synthetic record published today to the records served to get requests, every `interval` seconds.
+    '''
+    while True:
+        time.sleep(interval)
+        with server.lock:
+            i = len(server.rows)
+            record = next(synthetic_records(1, seed=i))
+            org = record['sequencing_org_code']
+            published = date.today()
+            record.update({
+                'id' : i + 1,
+                'central_sample_id' : f'{org}-{i:07d}',
+                'run_name' : f'{published:%y%m%d}_{org}_{i // 96:05d}',
+                'published_date' : str(published),
+            })
+            record['pag_name'] = f'{org}/{record["central_sample_id"]}:{record["run_name"]}'
+            server.rows.append(record)
+
+
+def serve(host='127.0.0.1', port=0, api_key=None, latency=0.0, error_rate=0.0, bulk=True, ranges=True, pagination=True, projection=True, aggregation=True, etags=True, max_url_length=None, rows=0, publish=None, verbose=False):
+    '''
+    Start a mock TQC server on a background thread, serving `rows` synthetic records to get requests.
+
+    If `publish` is given, a new record published today is served every `publish` seconds.
+
+    Returns the server, whose uploaded `records` can be inspected and which can be stopped with `shutdown()`.
+    '''
+    server = ThreadingHTTPServer((host, port), MockTQCHandler)
+    server.daemon_threads = True
+    server.api_key = api_key
+    server.latency = latency
+    server.error_rate = error_rate
+    server.bulk = bulk
+    server.ranges = ranges
+    server.pagination = pagination
+    server.projection = projection
+    server.aggregation = aggregation
+    server.etags = etags
+    server.max_url_length = max_url_length
+    server.rows = list(synthetic_records(rows))
+    server.verbose = verbose
+    server.records = {}
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    if publish:
+        threading.Thread(target=publish_records, args=(server, publish), daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the TQC server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', default=8000, type=int)
+    parser.add_argument('--api-key', default=None)
+    parser.add_argument('--latency', default=0.0, type=float, metavar=('SECONDS'), help='Delay added to every response')
+    parser.add_argument('--error-rate', default=0.0, type=float, metavar=('RATE'), help='Fraction of requests answered with 503 Service Unavailable')
+    parser.add_argument('--no-bulk', default=False, action='store_true', help='Respond to bulk uploads as if they are not supported')
+    parser.add_argument('--no-ranges', default=False, action='store_true', help='Do not advertise support for range filters')
+    parser.add_argument('--no-pagination', default=False, action='store_true', help='Do not advertise support for pagination')
+    parser.add_argument('--no-projection', default=False, action='store_true', help='Do not advertise support for returning only some fields')
+    parser.add_argument('--no-aggregation', default=False, action='store_true', help='Do not advertise support for computing stats')
+    parser.add_argument('--no-etags', default=False, action='store_true', help='Do not send ETags with get responses, or answer conditional requests')
+    parser.add_argument('--max-url-length', default=None, type=int, metavar=('N'), help='Respond to longer URLs with 414 URI Too Long')
+    parser.add_argument('--rows', default=1000, type=int, metavar=('N'), help='Number of synthetic records served to get requests. Default: 1000')
+    parser.add_argument('--publish', default=None, type=float, metavar=('SECONDS'), help='Publish a new synthetic record, dated today, every SECONDS')
+    parser.add_argument('--verbose', default=False, action='store_true')
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, api_key=args.api_key, latency=args.latency, error_rate=args.error_rate, bulk=not args.no_bulk, ranges=not args.no_ranges, pagination=not args.no_pagination, projection=not args.no_projection, aggregation=not args.no_aggregation, etags=not args.no_etags, max_url_length=args.max_url_length, rows=args.rows, publish=args.publish, verbose=args.verbose)
+    print(f'Mock TQC running on http://{args.host}:{server.server_port}', file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,24 @@
+import io
 import os
 import sys
 import csv
 import time
 import json
-import requests
+import gzip
+import copy
+import hashlib
+import sqlite3
 import argparse
-import pandas as pd
+import threading
+from http import HTTPStatus
+from urllib.parse import quote
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# requests, numpy and pandas are imported by the functions that use them, rather than here, 
+# so that commands which do not need them (e.g. add, a TSV get, or --help) start quickly
 
 
 def required_add_columns():
@@ -104,6 +116,32 @@ def numeric_columns():
     ]
 
 
+def integer_columns():
+    '''
+    Numeric columns in TQC with cells of type int.
+    '''
+    return [
+        'num_bases',
+        'longest_gap', 
+        'longest_ungap',
+        'num_pos', 
+        'tile_n'
+    ]
+
+
+def categorical_columns():
+    '''
+    Columns in TQC with few distinct values.
+    '''
+    return [
+        'sequencing_org_code',
+        'collection_pillar',
+        'library_primers',
+        'pag_suppressed',
+        'pag_basic_qc'
+    ]
+
+
 def date_columns():
     '''
     Columns in TQC containing date information.
@@ -159,9 +197,312 @@ def empty_cell():
     return '_'
 
 
-def add(url, api_key, tsv_path, print_uploads=True):
+def scratch_dir():
+    '''
+    Directory for the client's local files (failure logs, journals).
+    '''
+    return f"{os.getenv('EAGLEOWL_SCRATCH')}/tqc"
+
+
+def failures_log_path():
+    '''
+    Log that records failing to upload are appended to.
+    '''
+    return f'{scratch_dir()}/failures.log'
+
+
+def journal_path(tsv_path):
+    '''
+    Default checkpoint journal for uploads of `tsv_path`.
+    '''
+    if tsv_path == '-':
+        name = 'stdin'
+    else:
+        name = hashlib.sha1(os.path.abspath(tsv_path).encode()).hexdigest()
+    return f'{scratch_dir()}/journals/{name}.journal'
+
+
+def record_key(record):
+    '''
+    Values of the columns that identify a record in TQC.
+    '''
+    return tuple(record.get(x) or '' for x in required_add_columns())
+
+
+def alias_add_record(record):
+    '''
+    Rename the fields of a record read from a TSV to those expected by TQC.
+    '''
+    for name, replacement in column_aliases('add').items():
+        if record.get(name):
+            record[replacement] = record.pop(name)
+    return record
+
+
+def default_index_path():
+    '''
+    Default location of the local index of uploaded records.
+    '''
+    return f'{scratch_dir()}/index.sqlite'
+
+
+def open_index(path=None):
+    '''
+    Open the local index of uploaded records, creating it if it does not exist.
+
+    The index stores a hash of each record's payload, keyed by (central_sample_id, run_name, pag_name).
+    '''
+    if path is None:
+        path = default_index_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    index = sqlite3.connect(path)
+    index.execute(
+        'CREATE TABLE IF NOT EXISTS records ('
+        'central_sample_id TEXT NOT NULL, '
+        'run_name TEXT NOT NULL, '
+        'pag_name TEXT NOT NULL, '
+        'hash TEXT NOT NULL, '
+        'uploaded TEXT NOT NULL, '
+        'PRIMARY KEY (central_sample_id, run_name, pag_name)'
+        ') WITHOUT ROWID'
+    )
+    return index
+
+
+def payload_hash(record):
+    '''
+    Hash of a record's contents, independent of the order of its fields.
+    '''
+    return hashlib.sha1(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+def indexed_hash(index, record):
+    '''
+    Hash stored in the index for the record, or `None` if it has not been uploaded.
+    '''
+    row = index.execute(
+        'SELECT hash FROM records WHERE central_sample_id = ? AND run_name = ? AND pag_name = ?', 
+        record_key(record)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def update_index(index, record):
+    '''
+    Store the hash of a record that has been uploaded successfully.
+    '''
+    index.execute(
+        'INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)', 
+        (*record_key(record), payload_hash(record), datetime.today().strftime('%Y-%m-%d %H:%M:%S'))
+    )
+
+
+def make_session(workers=1):
+    '''
+    Session with a connection pool large enough for `workers` concurrent requests.
+    '''
+    import requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def bulk_unsupported_statuses():
+    '''
+    Response codes from the bulk endpoint indicating that the server does not support bulk uploads.
+    '''
+    return [
+        404,
+        405,
+        501
+    ]
+
+
+def retryable_statuses():
+    '''
+    Response codes indicating that an upload may succeed if it is sent again later.
+    '''
+    return [
+        429,
+        500,
+        502,
+        503,
+        504
+    ]
+
+
+def request_with_backoff(session, method, url, attempts=1, backoff=1.0, **kwargs):
+    '''
+    Make a request to `url`, making up to `attempts` attempts in total.
+
+    Connection errors and retryable responses are retried after `backoff` seconds, doubling each time.
+    '''
+    import requests
+    if attempts < 1:
+        raise Exception(f'Cannot make {attempts} attempts at a request')
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.ConnectionError:
+            if attempt == attempts - 1:
+                raise
+            continue
+        if not (response.status_code in retryable_statuses()):
+            break
+    return response
+
+
+def post_record(session, url, headers, record, payload, attempts=1, backoff=1.0):
+    '''
+    Post a single record to TQC.
+
+    Returns a list containing one `(record, payload, ok, status)` tuple.
+    '''
+    response = request_with_backoff(session, 'POST', f'{url}/add', attempts=attempts, backoff=backoff, data=payload, headers=headers)
+    return [(record, payload, response.ok, f'{response}: {response.reason}')]
+
+
+def post_batch(session, url, headers, batch, compress=False, attempts=1, backoff=1.0):
+    '''
+    Post a batch of `(record, payload)` pairs to TQC as newline-delimited JSON, optionally gzip-compressed.
+
+    Returns a list of `(record, payload, ok, status)` tuples, one per record in the batch, or `None` if the server does not support bulk uploads.
+    '''
+    body = ''.join(payload + '\n' for _, payload in batch).encode()
+    batch_headers = dict(headers)
+    batch_headers['Content-Type'] = 'application/x-ndjson'
+    if compress:
+        body = gzip.compress(body)
+        batch_headers['Content-Encoding'] = 'gzip'
+
+    response = request_with_backoff(session, 'POST', f'{url}/add/bulk', attempts=attempts, backoff=backoff, data=body, headers=batch_headers)
+
+    if response.status_code in bulk_unsupported_statuses():
+        return None
+
+    # The whole batch was rejected
+    if not response.ok:
+        return [(record, payload, False, f'{response}: {response.reason}') for record, payload in batch]
+
+    # Otherwise the server returns a list of results, in the same order as the records in the batch
+    results = json.loads(response.text)
+    if len(results) != len(batch):
+        # Results cannot be matched to records, so the whole batch is failed (and logged), to be retried
+        return [(record, payload, False, f'{response}: {len(results)} results for a batch of {len(batch)} records') for record, payload in batch]
+
+    statuses = []
+    for (record, payload), result in zip(batch, results):
+        status = int(result['status'])
+        try:
+            description = f'<Response [{status}]>: {HTTPStatus(status).phrase}'
+        except ValueError:
+            # Non-standard statuses (e.g. 499 or 520, from a proxy) have no phrase
+            description = f'<Response [{status}]>'
+        statuses.append((record, payload, 200 <= status < 400, description))
+    return statuses
+
+
+def upload_records(url, api_key, records, handle, workers=1, batch_size=1, compress=False, attempts=1, backoff=1.0, session=None):
+    '''
+    Upload `(record, payload)` pairs to TQC over `workers` concurrent requests, optionally in bulk batches of `batch_size` records.
+
+    `records` is consumed lazily, so that at most two batches per worker are held in memory.
+    `handle(record, payload, ok, status)` is called on the calling thread as each record's response arrives.
+    Uploads are made over `session` if given, otherwise over a new session that is closed afterwards.
+    '''
+    if workers < 1:
+        raise Exception('Number of workers must be at least 1')
+
+    if batch_size < 1:
+        raise Exception('Batch size must be at least 1')
+
+    headers = {'api_key': api_key}
+
+    # Switched off for the rest of the upload the first time the server turns down a batch
+    bulk_supported = batch_size > 1
+
+    with make_session(workers) if session is None else nullcontext(session) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def upload(batch):
+            nonlocal bulk_supported
+            if bulk_supported:
+                statuses = post_batch(session, url, headers, batch, compress=compress, attempts=attempts, backoff=backoff)
+                if statuses is not None:
+                    return statuses
+                bulk_supported = False
+
+            # Fall back to posting each record individually
+            statuses = []
+            for record, payload in batch:
+                statuses.extend(post_record(session, url, headers, record, payload, attempts=attempts, backoff=backoff))
+            return statuses
+
+        def submit(batch):
+            if bulk_supported:
+                pending.add(executor.submit(upload, batch))
+            else:
+                for record, payload in batch:
+                    pending.add(executor.submit(post_record, session, url, headers, record, payload, attempts=attempts, backoff=backoff))
+
+        # Wait on requests in flight until no more than `limit` remain
+        def drain(limit):
+            while len(pending) > limit:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    for status in future.result():
+                        handle(*status)
+
+        pending = set()
+        batch = []
+
+        for record, payload in records:
+            batch.append((record, payload))
+            if len(batch) < batch_size:
+                continue
+
+            submit(batch)
+            batch = []
+
+            # Stop reading records until a slot frees up
+            drain(2 * workers - 1)
+
+        # Post the final partial batch
+        if batch:
+            submit(batch)
+
+        drain(0)
+
+
+def print_summary(start, attempted, successful, failed, skipped=None, unchanged=None):
+    end = time.time()
+
+    print('[UPLOADS]')
+    print(f'Attempted: {attempted}')
+    print(f'Successful: {successful}')
+    print(f'Failed: {failed}')
+    if skipped is not None:
+        print(f'Skipped: {skipped}')
+    if unchanged is not None:
+        print(f'Unchanged: {unchanged}')
+    print('[TIME]')
+    print(f'{int((end - start) // 60)} m {round((end - start) % 60, 2)} s')
+
+
+def add(client, tsv_path, print_uploads=True, workers=1, batch_size=1, compress=False, resume=False, journal=None, incremental=False, index_path=None):
     start = time.time()
 
+    # Uploads from stdin cannot be told apart, so each needs a journal of its own to be resumed from
+    if resume and journal is None and tsv_path == '-':
+        raise Exception("Cannot pass --resume with a TSV_PATH of '-' without --journal")
+
+    if journal is None:
+        journal = journal_path(tsv_path)
+
     if tsv_path == '-':
         tsv = sys.stdin
     else:
@@ -170,6 +511,11 @@ def add(url, api_key, tsv_path, print_uploads=True):
     attempted = 0
     successful = 0
     failed = 0
+    skipped = 0
+    unchanged = 0
+
+    # The index is only kept up to date by incremental uploads, so that others need no write to it per record
+    index = open_index(index_path) if incremental else None
 
     try:
         reader = csv.DictReader(tsv, delimiter='\t')
@@ -178,49 +524,218 @@ def add(url, api_key, tsv_path, print_uploads=True):
             for x in required_add_columns():
                 if not (x in set(columns)):
                     raise Exception(f"'{x}' column is missing")
-            
-            request_url = f'{url}/add'
-            headers = {'api_key': api_key}
 
-            with open(f"{os.getenv('EAGLEOWL_SCRATCH')}/tqc/failures.log", "a") as failures:
-                # Iterate through tsv table
-                for record in reader:
-                    for name, replacement in column_aliases('add').items():
-                        if record.get(name):
-                            record[replacement] = record.pop(name)
-
-                    # Convert to json string
-                    payload = json.dumps(record)
-                    # Post the json
-                    response = requests.post(request_url, data=payload, headers=headers)
+            # Records that were acknowledged by a previous run of this upload
+            acknowledged = set()
+            if resume and os.path.isfile(journal):
+                with open(journal) as previous:
+                    for line in previous:
+                        acknowledged.add(tuple(line.rstrip('\n').split('\t')))
+
+            os.makedirs(scratch_dir(), exist_ok=True)
+            os.makedirs(os.path.dirname(os.path.abspath(journal)), exist_ok=True)
+
+            with open(failures_log_path(), "a") as failures, open(journal, "a" if resume else "w") as checkpoints:
+
+                def handle(record, payload, ok, status):
+                    nonlocal attempted, successful, failed
                     # (Optionally) print upload
                     if print_uploads:
-                        print(f'{response}: {response.reason}, id: {record["central_sample_id"]}, run: {record["run_name"]}, pag: {record["pag_name"]}')
-                    
+                        print(f'{status}, id: {record["central_sample_id"]}, run: {record["run_name"]}, pag: {record["pag_name"]}')
+
                     attempted += 1
-                    if response.ok:
+                    if ok:
                         successful += 1
+                        if index is not None:
+                            update_index(index, record)
                     else:
                         # First failure is marked with the date
                         if failed == 0:
                             failures.write(datetime.today().strftime('%Y-%m-%d') + '\n')
                         failed += 1
                         failures.write(payload + '\n')
+                        failures.flush()
+
+                    # Failed records are journaled too, as they are now the responsibility of the failures log
+                    checkpoints.write('\t'.join(record_key(record)) + '\n')
+                    checkpoints.flush()
+
+                def records():
+                    nonlocal skipped, unchanged
+                    # Iterate through tsv table
+                    for record in reader:
+                        if record_key(record) in acknowledged:
+                            skipped += 1
+                            continue
+
+                        record = alias_add_record(record)
+
+                        # Skip records that are identical to when they were last uploaded
+                        if incremental and indexed_hash(index, record) == payload_hash(record):
+                            unchanged += 1
+                            continue
+
+                        yield record
+
+                with timed(client.timings, 'upload'):
+                    client.add(records(), handle=handle, workers=workers, batch_size=batch_size, compress=compress, attempts=1)
     finally:
         if tsv is not sys.stdin:
             tsv.close()
 
-        end = time.time()
+        if index is not None:
+            index.commit()
+            index.close()
+
+        if client.timings is not None:
+            client.timings.rows = attempted
+        print_summary(start, attempted, successful, failed, skipped=skipped if resume else None, unchanged=unchanged if incremental else None)
+
+
+def read_failures(path):
+    '''
+    Stream the records in a failures log, skipping the date lines that head each upload's failures.
+    '''
+    with open(path) as log:
+        for line in log:
+            if line.startswith('{'):
+                yield json.loads(line)
+
+
+def retry(client, log_path=None, print_uploads=True, workers=1, batch_size=1, compress=False, attempts=5, backoff=1.0, incremental=False, index_path=None):
+    start = time.time()
+
+    if log_path is None:
+        log_path = failures_log_path()
+
+    if not os.path.isfile(log_path):
+        raise Exception(f"Failures log '{log_path}' does not exist")
+
+    # Only the most recent failure of each record is replayed
+    records = {}
+    for record in read_failures(log_path):
+        key = record_key(record)
+        records.pop(key, None)
+        records[key] = record
+
+    attempted = 0
+    successful = 0
+    failed = 0
+
+    # Records that still fail are compacted into a new log, which replaces the old one once every record has been replayed
+    compacted_path = log_path + '.compacted'
+    os.makedirs(scratch_dir(), exist_ok=True)
+
+    # As for add, the index is only kept up to date for incremental uploads
+    index = open_index(index_path) if incremental else None
+
+    try:
+        with open(compacted_path, 'w') as compacted:
+
+            def handle(record, payload, ok, status):
+                nonlocal attempted, successful, failed
+                # (Optionally) print upload
+                if print_uploads:
+                    print(f'{status}, id: {record["central_sample_id"]}, run: {record["run_name"]}, pag: {record["pag_name"]}')
+
+                attempted += 1
+                if ok:
+                    successful += 1
+                    if index is not None:
+                        update_index(index, record)
+                else:
+                    # First failure is marked with the date
+                    if failed == 0:
+                        compacted.write(datetime.today().strftime('%Y-%m-%d') + '\n')
+                    failed += 1
+                    compacted.write(payload + '\n')
+
+            with timed(client.timings, 'upload'):
+                client.add(
+                    records.values(), 
+                    handle=handle, 
+                    workers=workers, 
+                    batch_size=batch_size, 
+                    compress=compress, 
+                    attempts=attempts, 
+                    backoff=backoff
+                )
+
+        os.replace(compacted_path, log_path)
+    finally:
+        if index is not None:
+            index.commit()
+            index.close()
+
+        if client.timings is not None:
+            client.timings.rows = attempted
+        print_summary(start, attempted, successful, failed)
+
+
+def rebuild_index(tsv_paths, index_path=None):
+    '''
+    Replace the contents of the index with the records in `tsv_paths`, which are assumed to have been uploaded.
+
+    Where a record appears more than once, the last occurrence is kept.
+    '''
+    index = open_index(index_path)
+    try:
+        index.execute('DELETE FROM records')
+        for tsv_path in tsv_paths:
+            with nullcontext(sys.stdin) if tsv_path == '-' else open(tsv_path) as tsv:
+                reader = csv.DictReader(tsv, delimiter='\t')
+                if not reader.fieldnames:
+                    raise Exception(f"Failed to read fieldnames from '{tsv_path}'")
+                for x in required_add_columns():
+                    if not (x in set(reader.fieldnames)):
+                        raise Exception(f"'{x}' column is missing from '{tsv_path}'")
+                for record in reader:
+                    update_index(index, alias_add_record(record))
+        index.commit()
+        print(f'Indexed: {index.execute("SELECT COUNT(*) FROM records").fetchone()[0]}')
+    finally:
+        index.close()
+
+
+def index_info(index_path=None):
+    if index_path is None:
+        index_path = default_index_path()
+
+    index = open_index(index_path)
+    try:
+        count, last_upload = index.execute('SELECT COUNT(*), MAX(uploaded) FROM records').fetchone()
+    finally:
+        index.close()
+
+    print('[INDEX]')
+    print(f'Path: {os.path.abspath(index_path)}')
+    print(f'Records: {count}')
+    print(f'Last upload: {last_upload}')
+
 
-        print('[UPLOADS]')
-        print(f'Attempted: {attempted}')
-        print(f'Successful: {successful}')
-        print(f'Failed: {failed}')
-        print('[TIME]')
-        print(f'{int((end - start) // 60)} m {round((end - start) % 60, 2)} s')
+def dump_index(index_path=None):
+    index = open_index(index_path)
+    try:
+        print('\t'.join(required_add_columns() + ['hash', 'uploaded']))
+        for row in index.execute('SELECT * FROM records ORDER BY central_sample_id, run_name, pag_name'):
+            print('\t'.join(row))
+    finally:
+        index.close()
+
+
+def date_range_params(field, start_date, end_date, ranges=False):
+    '''
+    Query parameters matching all dates on `field` between `start_date` and `end_date`, inclusive.
+
+    If `ranges` is True, the range is given as a single `field=range_START_END` parameter. 
+    Otherwise, each date in the range is given as its own parameter.
+    '''
+    if ranges:
+        return [f'{field}=range_{start_date}_{end_date}']
+    return [f'{field}={start_date + timedelta(days=i)}' for i in range((end_date - start_date).days + 1)]
 
 
-def make_query_params(args, pag_defaults=True):
+def make_query_params(args, pag_defaults=True, ranges=False):
     if pag_defaults == True:
         # Default for pag_suppressed
         if args.get('pag_suppressed') is None:
@@ -267,9 +782,9 @@ def make_query_params(args, pag_defaults=True):
         elif arg in iso_week_args:
             for val in value:
                 year, week = val.split('-')
-                dates = [datetime.fromisocalendar(int(year), int(week), i).strftime('%Y-%m-%d') for i in range(1, 8)]
-                for date in dates:
-                    params.append(f'{arg[:-len("_iso_week")] + "_date"}={date}')
+                start_date = datetime.fromisocalendar(int(year), int(week), 1).date()
+                end_date = datetime.fromisocalendar(int(year), int(week), 7).date()
+                params.extend(date_range_params(arg[:-len("_iso_week")] + "_date", start_date, end_date, ranges=ranges))
 
         # Handle date range arguments (all dates within two dates, inclusive)
         elif arg in date_range_args:
@@ -282,16 +797,11 @@ def make_query_params(args, pag_defaults=True):
                 end_date = datetime.today().date()
             else:
                 end_date = datetime.strptime(value[1], '%Y-%m-%d').date()
-            difference = (end_date - start_date).days
             
-            if difference < 0:
+            if end_date < start_date:
                 raise Exception(f'{arg}: end_date is less than start_date')
 
-            dates = []
-            for i in range(difference + 1):
-                dates.append(start_date + timedelta(days=i))
-            for date in dates:
-                params.append(f'{arg[:-len("_range")]}={date}')
+            params.extend(date_range_params(arg[:-len("_range")], start_date, end_date, ranges=ranges))
         
         # Handle ISO week range arguments (all dates within two iso weeks, inclusive)
         elif arg in iso_week_range_args:
@@ -299,16 +809,11 @@ def make_query_params(args, pag_defaults=True):
             year2, week2 = value[1].split('-')
             start_date = datetime.fromisocalendar(int(year1), int(week1), 1).date()
             end_date = datetime.fromisocalendar(int(year2), int(week2), 7).date()
-            difference = (end_date - start_date).days
 
-            if difference < 0:
+            if end_date < start_date:
                 raise Exception(f'{arg}: end_date is less than start_date')
 
-            dates = []
-            for i in range(difference + 1):
-                dates.append(start_date + timedelta(days=i))
-            for date in dates:
-                params.append(f'{arg[:-len("_iso_week_range")] + "_date"}={date}')
+            params.extend(date_range_params(arg[:-len("_iso_week_range")] + "_date", start_date, end_date, ranges=ranges))
         
         # Handle numeric arguments
         elif arg in numeric_args:
@@ -340,6 +845,57 @@ def make_query_params(args, pag_defaults=True):
     return '&'.join(params)
 
 
+def server_capabilities(url, session=None):
+    '''
+    Optional features advertised by the server, e.g. `{'range_filters' : True, 'pagination' : True}`.
+
+    Servers that do not advertise anything are treated as supporting none of them.
+    '''
+    import requests
+    if session is None:
+        session = requests
+    try:
+        response = session.get(f'{url}/capabilities')
+    except requests.RequestException:
+        return {}
+
+    if not response.ok:
+        return {}
+    try:
+        return json.loads(response.text)
+    except json.JSONDecodeError:
+        return {}
+
+
+def shard_query_params(params, max_length):
+    '''
+    Split a query string from `make_query_params` into sub-queries that are each no longer than `max_length`.
+
+    The server ORs together the values given for a non-numeric field, so the field with the most values is split in half, 
+    with all other parameters repeated in both halves, until every sub-query fits. The union of the sub-queries' results is the result of the original query.
+    '''
+    if len(params) <= max_length:
+        return [params]
+
+    fields = {}
+    for param in params.split('&'):
+        fields.setdefault(param.split('=', 1)[0], []).append(param)
+
+    # Values for numeric fields are AND'd together, so cannot be split
+    splittable = [field for field, values in fields.items() if len(values) > 1 and not (field in numeric_columns())]
+    if not splittable:
+        raise Exception(f'Query cannot be split into sub-queries shorter than {max_length} characters')
+
+    field = max(splittable, key=lambda x: len(fields[x]))
+    values = fields[field]
+
+    shards = []
+    for half in [values[:len(values) // 2], values[len(values) // 2:]]:
+        sub_params = '&'.join('&'.join(half if x == field else fields[x]) for x in fields)
+        shards.extend(shard_query_params(sub_params, max_length))
+    return shards
+
+
 def read_records(path):
     records = []
     with open(path) as tsv:
@@ -353,174 +909,2807 @@ def read_records(path):
     return records
 
 
-def get(url, args, metadata_path=None, pag_defaults=None):
-    request_url = f'{url}/get'
-    params = make_query_params(args, pag_defaults=pag_defaults)
+def open_metadata_file(metadata_path):
+    '''
+    Open a metadata TSV for reading as bytes, decompressing it if it is gzipped.
+    '''
+    with open(metadata_path, 'rb') as metadata_file:
+        magic = metadata_file.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(metadata_path, 'rb')
+    return open(metadata_path, 'rb')
 
-    # If any parameters have been passed to filter on
-    if params:
-        request_url += '/?' + params        
 
-    # Get response and store in dataframe
-    response = requests.get(request_url)
+def metadata_fields(line):
+    '''
+    Fields of a line of a metadata TSV.
+    '''
+    line = line.decode().rstrip('\r\n')
+    # Only lines with quotes need the csv module to split them
+    if '"' in line:
+        return next(csv.reader([line], delimiter='\t'))
+    return line.split('\t')
 
-    if not response.ok:
-        print(f'{response}: {response.reason}. {json.loads(response.text).get("detail")}')
-    else:
-        df = pd.json_normalize(json.loads(response.text))
-        # If we have a non-empty search result
-        if list(df.columns.values):
-            # Delete id column from the dataframe
-            df = df.drop('id', axis=1)
-            # Rename columns
-            df = df.rename(columns=column_aliases('get')) # type: ignore
-            # Reorder columns
-            df = df[returned_get_columns()]
-
-            # Annotate the TQC output table with additional metadata, if it was supplied
-            if metadata_path:
-                metadata = pd.DataFrame.from_records(read_records(metadata_path))
-                metadata = metadata.rename({'library_primers' : 'meta.library_primers'}, axis=1)
-                df = df.merge(metadata, on=list(metadata.columns.intersection(df.columns)), how='left')
-            
-            # Print the data
-            print(df.to_csv(index=False, sep='\t'), end='')
-        else:
-            # Print an empty table
-            print('\t'.join(returned_get_columns()))
 
+def metadata_header(metadata_path):
+    '''
+    Columns of a metadata TSV, as they are named in the annotated TQC output table.
+    '''
+    with open_metadata_file(metadata_path) as metadata_file:
+        header = metadata_fields(metadata_file.readline())
+    if header == ['']:
+        raise Exception('Failed to read fieldnames from metadata file')
+    return ['meta.library_primers' if x == 'library_primers' else x for x in header]
 
-def main():
-    parser = argparse.ArgumentParser()
-    request_parsers = parser.add_subparsers(dest='request_type', required=True)
-    
-    # Add request
-    add_parser = request_parsers.add_parser('add', allow_abbrev=False)
-    add_parser.add_argument('tsv_path', metavar=('TSV_PATH'))
 
-    add_parser.add_argument('--hide-uploads', default=False, action='store_true')
-    add_parser.add_argument('--host', default=os.getenv('TQC_IP'))
-    add_parser.add_argument('--port', default=os.getenv('TQC_PORT'))
-    add_parser.add_argument('--api-key', default=os.getenv('TQC_ADD_KEY'))
-    
-    # Get request
-    get_parser = request_parsers.add_parser('get', allow_abbrev=False, description='operators: lt, gt, leq, geq, eq, neq')
-    get_parser.add_argument('--central-sample-id', default=None, nargs='+', action='append')
-    get_parser.add_argument('--run-name', default=None, nargs='+', action='append')
-    get_parser.add_argument('--pag-name', default=None, nargs='+', action='append')
-    get_parser.add_argument('--pag-suppressed', default=None, nargs='+', action='append', help='Default: valid PAGs only')
-    get_parser.add_argument('--pag-basic-qc', default=None, nargs='+', action='append', help='Default: passed PAGs only')
-    get_parser.add_argument('--all', default=False, action='store_true', help='Ignore defaults regarding PAG suppression and basic QC passing')
-    get_parser.add_argument('--sequencing-org-code', default=None, nargs='+', action='append')
-    get_parser.add_argument('--foel-producer', default=None, nargs='+', action='append')
-    get_parser.add_argument('--phe-private-provider', default=None, nargs='+', action='append')
-    get_parser.add_argument('--phe-site', default=None, nargs='+', action='append')
-    get_parser.add_argument('--collection-pillar', default=None, nargs='+', action='append')
+def join_keys(header, columns, keys=None):
+    '''
+    Columns to join the metadata on: `keys` if given, otherwise every column the metadata shares with the TQC output table.
+    '''
+    if keys:
+        for x in keys:
+            if not (x in header):
+                raise Exception(f"Join key '{x}' is not a column of the metadata")
+            if not (x in columns):
+                raise Exception(f"Join key '{x}' is not a column of the TQC output table")
+        return list(keys)
 
-    # Currently makes more sense to keep date filtering arguments for a given field separate from the same get request
-    # As otherwise we would be doing an implicit mix of unions (between date arguments) and intersections (with every other argument) when matching rows
-    # That could get confusing
+    keys = [x for x in header if x in columns]
+    if not keys:
+        raise Exception('The metadata has no columns in common with the TQC output table. Choose the columns to join on with --metadata-key')
+    return keys
 
-    collection_date_parser = get_parser.add_mutually_exclusive_group()
-    collection_date_parser.add_argument('--collection-date', default=None, nargs='+', metavar=('YYYY-MM-DD'), action='append')
-    collection_date_parser.add_argument('--collection-date-range', default=None, nargs=2, metavar=('YYYY-MM-DD', 'YYYY-MM-DD'), action='append')
-    collection_date_parser.add_argument('--collection-iso-week', default=None, nargs='+', metavar=('YYYY-WW'), action='append')
-    collection_date_parser.add_argument('--collection-iso-week-range', default=None, nargs=2, metavar=('YYYY-WW', 'YYYY-WW'), action='append')
 
-    received_date_parser = get_parser.add_mutually_exclusive_group()
-    received_date_parser.add_argument('--received-date', default=None, nargs='+', metavar=('YYYY-MM-DD'), action='append')
-    received_date_parser.add_argument('--received-date-range', default=None, nargs=2, metavar=('YYYY-MM-DD', 'YYYY-MM-DD'), action='append')
-    received_date_parser.add_argument('--received-iso-week', default=None, nargs='+', metavar=('YYYY-WW'), action='append')
-    received_date_parser.add_argument('--received-iso-week-range', default=None, nargs=2, metavar=('YYYY-WW', 'YYYY-WW'), action='append')
+def metadata_index_path(metadata_path):
+    '''
+    Location of the key index of a metadata TSV, kept next to it.
+    '''
+    return f'{metadata_path}.tqcindex'
 
-    sequencing_org_received_date_parser = get_parser.add_mutually_exclusive_group()
-    sequencing_org_received_date_parser.add_argument('--sequencing-org-received-date', default=None, nargs='+', metavar=('YYYY-MM-DD'), action='append')
-    sequencing_org_received_date_parser.add_argument('--sequencing-org-received-date-range', default=None, nargs=2, metavar=('YYYY-MM-DD', 'YYYY-MM-DD'), action='append')
-    sequencing_org_received_date_parser.add_argument('--sequencing-org-received-iso-week', default=None, nargs='+', metavar=('YYYY-WW'), action='append')
-    sequencing_org_received_date_parser.add_argument('--sequencing-org-received-iso-week-range', default=None, nargs=2, metavar=('YYYY-WW', 'YYYY-WW'), action='append')
 
-    sequencing_submission_date_parser = get_parser.add_mutually_exclusive_group()
-    sequencing_submission_date_parser.add_argument('--sequencing-submission-date', default=None, nargs='+', metavar=('YYYY-MM-DD'), action='append')
-    sequencing_submission_date_parser.add_argument('--sequencing-submission-date-range', default=None, nargs=2, metavar=('YYYY-MM-DD', 'YYYY-MM-DD'), action='append')
-    sequencing_submission_date_parser.add_argument('--sequencing-submission-iso-week', default=None, nargs='+', metavar=('YYYY-WW'), action='append')
-    sequencing_submission_date_parser.add_argument('--sequencing-submission-iso-week-range', default=None, nargs=2, metavar=('YYYY-WW', 'YYYY-WW'), action='append')
+def build_metadata_index(index, metadata_path, header, keys, stamp):
+    '''
+    Index the byte offset (in the decompressed file) of every row of a metadata TSV by the values of its join keys.
+    '''
+    positions = [header.index(x) for x in keys]
+
+    def iter_keys():
+        with open_metadata_file(metadata_path) as metadata_file:
+            offset = len(metadata_file.readline())
+            for line in metadata_file:
+                if line.strip():
+                    fields = metadata_fields(line)
+                    yield '\t'.join(fields[i].strip() if i < len(fields) else '' for i in positions), offset
+                offset += len(line)
+
+    # The stamp is cleared before anything else, so that an interrupted build is redone rather than trusted
+    index.execute('DELETE FROM meta')
+    index.commit()
+    index.execute('DROP TABLE IF EXISTS rows')
+    index.execute('CREATE TABLE rows (key TEXT NOT NULL, offset INTEGER NOT NULL)')
+    index.executemany('INSERT INTO rows VALUES (?, ?)', iter_keys())
+    index.execute('CREATE INDEX rows_key ON rows (key)')
+    index.executemany('INSERT INTO meta VALUES (?, ?)', stamp.items())
+    index.commit()
+
+
+@contextmanager
+def open_metadata(metadata_path, columns=None, keys=None):
+    '''
+    Open a metadata TSV (which may be gzipped) for annotating the TQC output table, joining on `keys`.
 
-    published_date_parser = get_parser.add_mutually_exclusive_group()
-    published_date_parser.add_argument('--published-date', default=None, nargs='+', metavar=('YYYY-MM-DD'), action='append')
-    published_date_parser.add_argument('--published-date-range', default=None, nargs=2, metavar=('YYYY-MM-DD', 'YYYY-MM-DD'), action='append')
-    published_date_parser.add_argument('--published-iso-week', default=None, nargs='+', metavar=('YYYY-WW'), action='append')
-    published_date_parser.add_argument('--published-iso-week-range', default=None, nargs=2, metavar=('YYYY-WW', 'YYYY-WW'), action='append')
+    The metadata is read once to build a key index, which is kept next to it and reused until the file or the keys change.
+    If the index cannot be written there, it is kept in memory instead.
+    '''
+    header = metadata_header(metadata_path)
+    keys = join_keys(header, projected_columns(columns), keys=keys)
+    stat = os.stat(metadata_path)
+    stamp = {'keys' : json.dumps(keys), 'size' : str(stat.st_size), 'mtime' : str(stat.st_mtime_ns)}
+
+    for index_path in [metadata_index_path(metadata_path), ':memory:']:
+        index = sqlite3.connect(index_path, timeout=30)
+        try:
+            index.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            if dict(index.execute('SELECT name, value FROM meta').fetchall()) != stamp:
+                build_metadata_index(index, metadata_path, header, keys, stamp)
+            break
+        except sqlite3.OperationalError:
+            index.close()
+            if index_path == ':memory:':
+                raise
 
-    get_parser.add_argument('--fasta-path', default=None, nargs='+', action='append')
-    get_parser.add_argument('--bam-path', default=None, nargs='+', action='append')
-    get_parser.add_argument('--library-primers', default=None, nargs='+', action='append')
-    get_parser.add_argument('--library-primers-reported', default=None, nargs='+', action='append')
+    try:
+        yield {'path' : metadata_path, 'header' : header, 'keys' : keys, 'index' : index}
+    finally:
+        index.close()
 
-    # FASTA QC
-    get_parser.add_argument('--num-bases', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-acgt', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-masked', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-invalid', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-ambiguous', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--longest-gap', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--longest-ungap', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
 
-    # BAM QC
-    get_parser.add_argument('--num-pos', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--mean-cov', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-pos-cov-gte1', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-pos-cov-gte5', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-pos-cov-gte10', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-pos-cov-gte20', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-pos-cov-gte50', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-pos-cov-gte100', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-pos-cov-gte200', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-tiles-medcov-gte1', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-tiles-medcov-gte5', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-tiles-medcov-gte10', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-tiles-medcov-gte20', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-tiles-medcov-gte50', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-tiles-medcov-gte100', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--pc-tiles-medcov-gte200', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-    get_parser.add_argument('--tile-n', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
-
-    get_parser.add_argument('--metadata', default=None, metavar=('TSV_PATH'))
+def lookup_metadata(metadata, df):
+    '''
+    Rows of the metadata whose join keys match a row of the TQC output table `df`, read using the key index.
+    '''
+    import pandas as pd
+    # Keys are matched on their values as written in the TQC output table
+    text = df[metadata['keys']].to_csv(sep='\t', header=False, index=False)
+    wanted = sorted({'\t'.join(row) for row in csv.reader(io.StringIO(text), delimiter='\t')})
+
+    offsets = []
+    for i in range(0, len(wanted), 500):
+        batch = wanted[i : i + 500]
+        offsets.extend(offset for offset, in metadata['index'].execute(f'SELECT offset FROM rows WHERE key IN ({", ".join("?" for _ in batch)})', batch))
+
+    header = metadata['header']
+    rows = []
+    # Rows are read in the order they appear in the file, so gzipped files are only decompressed once
+    with open_metadata_file(metadata['path']) as metadata_file:
+        for offset in sorted(offsets):
+            metadata_file.seek(offset)
+            fields = [x.strip() for x in metadata_fields(metadata_file.readline())]
+            rows.append((fields + [''] * len(header))[:len(header)])
+    return pd.DataFrame(rows, columns=header, dtype=object)
+
+
+def output_formats():
+    '''
+    Formats that the TQC output table can be written in.
+    '''
+    return ['tsv', 'parquet', 'arrow', 'feather', 'ndjson']
+
+
+def binary_formats():
+    return ['parquet', 'arrow', 'feather']
+
+
+def projected_columns(columns):
+    '''
+    Columns of the TQC output table to return, in the order given. Defaults to all of them.
+    '''
+    if not columns:
+        return returned_get_columns()
+
+    projected = []
+    for x in columns:
+        if not (x in returned_get_columns()):
+            raise Exception(f"Cannot return unknown column '{x}'")
+        if not (x in projected):
+            projected.append(x)
+    return projected
+
+
+def projection_fields(columns):
+    '''
+    Fields requested from the server for a projection onto `columns`, named as they are by the server.
+
+    The `id` field is always included, as it is used to merge the results of sub-queries.
+    '''
+    aliases = column_aliases('add')
+    return ['id'] + [aliases.get(x, x) for x in columns]
+
+
+def fits_single_precision(array):
+    '''
+    Whether every value in a float64 array has few enough significant digits (6) to be held as a float32 and printed back unchanged.
+    '''
+    import numpy as np
+    present = array[np.isfinite(array) & (array != 0)]
+    if not present.size:
+        return True
+    scaled = present * 10.0 ** (5 - np.floor(np.log10(np.abs(present))))
+    return bool(np.all(np.abs(scaled - np.round(scaled)) < 1e-6))
+
+
+def date_value(value):
+    '''
+    The YYYY-MM-DD date of an ISO 8601 date or datetime, or `None` if it is empty.
+    '''
+    if value is None or value == '':
+        return None
+    try:
+        date = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise Exception(f"Encountered invalid date '{value}'")
+    return value if len(value) == 10 else date.strftime('%Y-%m-%d')
+
+
+def typed_column(name, values):
+    '''
+    Build the column `name` of the TQC output table from a list of values, with the most compact dtype its schema allows.
+    '''
+    import numpy as np
+    import pandas as pd
+    if name in numeric_columns():
+        # Missing values (and empty cells) become NaN
+        array = np.array([None if value == '' else value for value in values], dtype='float64')
+        missing = np.isnan(array)
+        present = array[~missing]
+
+        if name in integer_columns() and np.all(present % 1 == 0):
+            low, high = (present.min(), present.max()) if present.size else (0, 0)
+            for dtype in ['int8', 'int16', 'int32', 'int64']:
+                if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                    break
+            # Columns with missing values use pandas' nullable integers
+            if missing.any():
+                return pd.array(array, dtype=dtype.capitalize())
+            return array.astype(dtype)
+
+        if fits_single_precision(array):
+            return array.astype('float32')
+        return array
+
+    elif name in date_columns():
+        # Datetimes keep their date, and anything else that is not a date is rejected rather than blanked
+        return pd.to_datetime(pd.Series([date_value(value) for value in values], dtype=object), format='%Y-%m-%d')
+
+    elif name in categorical_columns():
+        return pd.Categorical(values)
+
+    else:
+        return pd.Series(values, dtype=object)
+
+
+def results_dataframe(results, metadata=None, columns=None):
+    '''
+    Build the TQC output table from the results of a get request, optionally annotated with `metadata` (from `open_metadata`) and projected onto `columns`.
+
+    Columns are built directly from the results with the dtypes given by the schema of TQC, 
+    rather than being inferred by `pd.json_normalize`. Returns `None` if there are no results.
+    '''
+    import pandas as pd
+    # If we have an empty search result
+    if not results:
+        return None
+
+    # Flatten nested fields, if there are any
+    if any(isinstance(value, dict) for value in results[0].values()):
+        results = [flatten_result(result) for result in results]
+
+    # Build each column from the field it is renamed from, in order
+    aliases = column_aliases('add')
+    df = pd.DataFrame({x : typed_column(x, [result.get(aliases.get(x, x)) for result in results]) for x in projected_columns(columns)})
+
+    # Annotate the TQC output table with additional metadata, if it was supplied
+    if metadata is not None:
+        matched = lookup_metadata(metadata, df)
+        # Metadata is read as strings, so the columns being joined on are converted to match the TQC output table
+        for x in metadata['keys']:
+            if x in numeric_columns():
+                matched[x] = pd.to_numeric(matched[x], errors='coerce')
+            elif x in date_columns():
+                matched[x] = pd.to_datetime(matched[x], format='%Y-%m-%d', errors='coerce')
+        df = df.merge(matched, on=metadata['keys'], how='left')
+    return df
+
+
+def empty_dataframe(columns=None):
+    '''
+    The TQC output table for a get request with no results.
+    '''
+    import pandas as pd
+    return pd.DataFrame({x : typed_column(x, []) for x in projected_columns(columns)})
+
+
+@contextmanager
+def open_output(output_path=None, output_format='tsv'):
+    '''
+    Open `output_path` for writing the TQC output table in `output_format`, or use stdout if it is `None`.
+    '''
+    binary = output_format in binary_formats()
+    if output_path is None:
+        yield sys.stdout.buffer if binary else sys.stdout
+    else:
+        with open(output_path, 'wb' if binary else 'w') as out:
+            yield out
+
+
+def import_pyarrow(output_format):
+    try:
+        import pyarrow
+    except ImportError:
+        raise Exception(f"Writing --format {output_format} requires pyarrow. Install it with 'pip install pyarrow'")
+    return pyarrow
+
+
+def json_dataframe(df):
+    '''
+    Copy of the TQC output table with dates as strings, and floats as the same decimals that are written to a TSV.
+    '''
+    import pandas as pd
+    df = df.copy()
+    for x in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[x]):
+            df[x] = df[x].dt.strftime('%Y-%m-%d')
+        # Single-precision floats are widened through their shortest decimal representation, so 83.38 stays 83.38
+        elif df[x].dtype == 'float32':
+            df[x] = pd.to_numeric(df[x].astype(str))
+    return df
+
+
+def write_dataframe(df, out, output_format='tsv', header=True):
+    '''
+    Write the TQC output table to the file `out` in `output_format`.
+
+    Only the text formats (tsv and ndjson) can be written a piece at a time, by calling this repeatedly with `header=False` after the first piece.
+    '''
+    if output_format == 'tsv':
+        out.write(df.to_csv(index=False, header=header, sep='\t'))
+
+    elif output_format == 'ndjson':
+        df = json_dataframe(df).astype(object)
+        df = df.where(df.notna(), None)
+        for record in df.to_dict('records'):
+            out.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    elif output_format in binary_formats():
+        pyarrow = import_pyarrow(output_format)
+        if output_format == 'parquet':
+            df.to_parquet(out, index=False)
+        elif output_format == 'feather':
+            df.to_feather(out)
+        else:
+            # The Arrow IPC stream format, which unlike feather can be read from a pipe
+            import pyarrow.ipc
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            with pyarrow.ipc.new_stream(out, table.schema) as writer:
+                writer.write_table(table)
+
+    else:
+        raise Exception(f"Unknown output format '{output_format}'")
+    out.flush()
+
 
+def iter_json_array(chunks):
+    '''
+    Incrementally parse a JSON array from an iterable of text chunks, yielding each element as soon as it is complete.
+    '''
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+
+    for chunk in chunks:
+        buffer += chunk
+        pos = 0
+        while True:
+            # Skip whitespace and separators between elements
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buffer):
+                break
+
+            if not started:
+                if buffer[pos] != '[':
+                    raise Exception('Expected a JSON array')
+                started = True
+                pos += 1
+                continue
+
+            if buffer[pos] == ']':
+                return
+
+            try:
+                element, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The element is incomplete, so wait for the next chunk
+                break
+            yield element
+
+        buffer = buffer[pos:]
+
+    raise Exception('Unexpected end of JSON array')
+
+
+def flatten_result(result, prefix=''):
+    '''
+    Flatten nested fields of a result into dot-separated names, in the same way as `pd.json_normalize`.
+    '''
+    flat = {}
+    for name, value in result.items():
+        if isinstance(value, dict):
+            flat.update(flatten_result(value, prefix=f'{prefix}{name}.'))
+        else:
+            flat[f'{prefix}{name}'] = value
+    return flat
+
+
+def integer_value(value):
+    '''
+    A value of an integer column, as written in the TQC output table. Whole floats (e.g. 29903.0) become ints.
+    '''
+    if type(value) is int:
+        return value
+    if value is None or value == '':
+        return None
+    number = float(value)
+    if number != number:
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def float_value(value):
+    '''
+    A value of a non-integer numeric column, as written in the TQC output table.
+    '''
+    if type(value) is float and value == value:
+        return value
+    if value is None or value == '':
+        return None
+    number = float(value)
+    return None if number != number else number
+
+
+def cell_converters(columns=None):
+    '''
+    Conversions of the numeric and date columns of the TQC output table, applied to rows written one at a time,
+    so that they are written with the same values as when the whole table is built with `typed_column`.
+    '''
+    converters = {}
+    for x in projected_columns(columns):
+        if x in integer_columns():
+            converters[x] = integer_value
+        elif x in numeric_columns():
+            converters[x] = float_value
+        elif x in date_columns():
+            converters[x] = date_value
+    return converters
+
+
+def result_record(result, aliases, columns=None, converters=None):
+    '''
+    A result from a get request, renamed by `aliases` and projected onto `columns`, in order.
+
+    Numeric and date values are converted by `converters` (by default, `cell_converters(columns)`).
+    '''
+    if converters is None:
+        converters = cell_converters(columns)
+    row = {aliases.get(name, name) : value for name, value in flatten_result(result).items()}
+    record = {x : row.get(x) for x in projected_columns(columns)}
+    for x, convert in converters.items():
+        record[x] = convert(record[x])
+    return record
+
+
+def result_row(result, aliases, columns=None, converters=None):
+    '''
+    Values of a result from a get request, renamed by `aliases` and in the order of `columns` (by default, `returned_get_columns()`).
+    '''
+    return ['' if value is None else value for value in result_record(result, aliases, columns=columns, converters=converters).values()]
+
+
+class ResponseError(Exception):
+    '''
+    Raised when TQC responds to a get request with an error.
+    '''
+    def __init__(self, response):
+        self.response = response
+        super().__init__(f'{response}: {response.reason}')
+
+
+def print_response_error(response, file=None):
+    print(f'{response}: {response.reason}. {json.loads(response.text).get("detail")}', file=file)
+
+
+def query_urls(url, args, capabilities, pag_defaults=None, max_url_length=8000, columns=None):
+    '''
+    URLs for a get request, split into as many sub-queries as are needed to keep each URL within `max_url_length`.
+
+    If `columns` are given and the server supports projection, only their fields are requested.
+    '''
+    request_url = f'{url}/get'
+
+    # Compile date ranges into single parameters if the server can evaluate them, rather than one parameter per day
+    params = make_query_params(args, pag_defaults=pag_defaults, ranges=capabilities.get('range_filters', False))
+
+    # Leave room for pagination parameters
+    if capabilities.get('pagination', False):
+        max_url_length -= len('&limit=&offset=') + 2 * 20
+
+    # Ask for only the fields that are needed, so that the rest are never transferred or parsed
+    fields = ''
+    if columns and capabilities.get('projection', False):
+        fields = 'fields=' + ','.join(projection_fields(columns))
+        max_url_length -= len('&' + fields)
+
+    # If any parameters have been passed to filter on
+    if params:
+        return [request_url + '/?' + '&'.join(filter(None, [shard, fields])) for shard in shard_query_params(params, max_url_length - len(request_url + '/?'))]
+    elif fields:
+        return [request_url + '/?' + fields]
+    else:
+        return [request_url]
+
+
+def iter_pages(session, request_urls, page_size=None, parallel=4, attempts=1, backoff=1.0, timings=None):
+    '''
+    Yield the list of results in each page of the get requests in `request_urls`, in order.
+
+    If `page_size` is given, each request is split into pages of `page_size` results with `limit` and `offset` parameters, and pages are fetched `parallel` at a time.
+    Otherwise each request is fetched whole, `parallel` requests at a time.
+    Pages that fail with a retryable response are retried on their own, up to `attempts` times, before a `ResponseError` is raised.
+    '''
+    if page_size is not None and page_size < 1:
+        raise Exception(f'Cannot fetch pages of {page_size} results')
+
+    def fetch(page_url):
+        response = request_with_backoff(session, 'GET', page_url, attempts=attempts, backoff=backoff)
+        if not response.ok:
+            raise ResponseError(response)
+        with timed(timings, 'decode'):
+            return json.loads(response.text)
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        if page_size is None:
+            yield from executor.map(fetch, request_urls)
+            return
+
+        for request_url in request_urls:
+            separator = '&' if '?' in request_url else '/?'
+            pages = deque()
+            offset = 0
+            finished = False
+
+            while True:
+                # Keep up to `parallel` pages in flight
+                while not finished and len(pages) < parallel:
+                    pages.append(executor.submit(fetch, f'{request_url}{separator}limit={page_size}&offset={offset}'))
+                    offset += page_size
+
+                if not pages:
+                    break
+
+                results = pages.popleft().result()
+                yield results
+
+                # A short page is the last one, so any pages requested after it are empty
+                if len(results) < page_size:
+                    finished = True
+                    for page in pages:
+                        page.cancel()
+                    pages.clear()
+
+
+def default_cache_dir():
+    '''
+    Directory for cached get results, set by `TQC_CACHE_DIR`.
+
+    Defaults to the scratch directory on CLIMB, or `~/.cache/tqc` elsewhere.
+    '''
+    if os.getenv('TQC_CACHE_DIR'):
+        return os.getenv('TQC_CACHE_DIR')
+    elif os.getenv('EAGLEOWL_SCRATCH'):
+        return f'{scratch_dir()}/cache'
+    else:
+        return os.path.expanduser('~/.cache/tqc')
+
+
+def open_cache(cache_dir=None):
+    '''
+    Open the cache of get results, creating it if it does not exist.
+
+    Results are stored as gzip-compressed JSON, alongside when they expire and when they were last used.
+    '''
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    cache = sqlite3.connect(f'{cache_dir}/cache.sqlite', timeout=30)
+    cache.execute(
+        'CREATE TABLE IF NOT EXISTS entries ('
+        'key TEXT PRIMARY KEY, '
+        'query TEXT NOT NULL, '
+        'expires REAL NOT NULL, '
+        'accessed REAL NOT NULL, '
+        'size INTEGER NOT NULL, '
+        'data BLOB NOT NULL'
+        ')'
+    )
+    cache.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+    return cache
+
+
+def cache_query(url, args, pag_defaults=None, columns=None):
+    '''
+    Canonical form of a get request, independent of the order its parameters (and projected columns) were given in.
+    '''
+    # Ranges are always expanded here, so that the query is the same whatever the server supports
+    params = make_query_params(copy.deepcopy(args), pag_defaults=pag_defaults, ranges=False)
+    params = sorted(set(params.split('&'))) if params else []
+    if columns:
+        params.append('fields=' + ','.join(sorted(projection_fields(columns))))
+    return f'{url}/get/?' + '&'.join(params) if params else f'{url}/get'
+
+
+def cache_ttl(args, ttl):
+    '''
+    How long, in seconds, the results of a get request can be cached for.
+
+    Requests that match on today's date are only cached for up to five minutes, as new data arrives throughout the day.
+    '''
+    for value in args.values():
+        if isinstance(value, str):
+            value = [value]
+        for val in value or []:
+            if isinstance(val, str) and val.lower() == 'today':
+                return min(ttl, 300)
+    return ttl
+
+
+def count_cache_stat(cache, name):
+    cache.execute('INSERT INTO stats VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET value = value + 1', (name,))
+
+
+def cache_get(cache, query):
+    '''
+    Cached results for `query`, or `None` if there are none that have not expired.
+    '''
+    key = hashlib.sha1(query.encode()).hexdigest()
+    now = time.time()
+    row = cache.execute('SELECT data FROM entries WHERE key = ? AND expires > ?', (key, now)).fetchone()
+    if row is None:
+        count_cache_stat(cache, 'misses')
+        cache.commit()
+        return None
+
+    count_cache_stat(cache, 'hits')
+    cache.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+    cache.commit()
+    return json.loads(gzip.decompress(row[0]))
+
+
+def cache_put(cache, query, results, ttl, max_size):
+    '''
+    Cache the results for `query`, then evict expired and least recently used entries until the cache is no larger than `max_size` bytes.
+    '''
+    key = hashlib.sha1(query.encode()).hexdigest()
+    now = time.time()
+    data = gzip.compress(json.dumps(results, separators=(',', ':')).encode())
+    cache.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)', (key, query, now + ttl, now, len(data), data))
+    cache.execute('DELETE FROM entries WHERE expires <= ?', (now,))
+
+    size = cache.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+    if size > max_size:
+        for key, entry_size in cache.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall():
+            cache.execute('DELETE FROM entries WHERE key = ?', (key,))
+            size -= entry_size
+            if size <= max_size:
+                break
+    cache.commit()
+
+
+def cache_stats(cache_dir=None):
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+
+    cache = open_cache(cache_dir)
+    try:
+        entries, size = cache.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE expires > ?', (time.time(),)).fetchone()
+        stats = dict(cache.execute('SELECT name, value FROM stats').fetchall())
+    finally:
+        cache.close()
+
+    hits = stats.get('hits', 0)
+    misses = stats.get('misses', 0)
+
+    print('[CACHE]')
+    print(f'Path: {os.path.abspath(cache_dir)}')
+    print(f'Entries: {entries}')
+    print(f'Size: {round(size / 1024 ** 2, 2)} MB')
+    print(f'Hits: {hits}')
+    print(f'Misses: {misses}')
+    if hits + misses:
+        print(f'Hit rate: {round(100 * hits / (hits + misses), 2)}%')
+
+
+def clear_cache(cache_dir=None):
+    cache = open_cache(cache_dir)
+    try:
+        cache.execute('DELETE FROM entries')
+        cache.execute('DELETE FROM stats')
+        cache.commit()
+        cache.execute('VACUUM')
+    finally:
+        cache.close()
+
+
+def fetch_results(url, args, pag_defaults=None, max_url_length=8000, parallel=4, page_size=None, parallel_pages=4, attempts=1, columns=None, session=None, capabilities=None, timings=None):
+    '''
+    Results of a get request, as a list of dictionaries.
+
+    Raises a `ResponseError` if the server responds with an error.
+    '''
+    results = []
+
+    with make_session(max(parallel, parallel_pages)) if session is None else nullcontext(session) as session:
+        if capabilities is None:
+            capabilities = server_capabilities(url, session=session)
+        with timed(timings, 'query'):
+            request_urls = query_urls(url, args, capabilities, pag_defaults=pag_defaults, max_url_length=max_url_length, columns=columns)
+
+        # Paginate if the server supports it
+        if not capabilities.get('pagination', False):
+            page_size = None
+
+        # Merge the results of the sub-queries, which overlap if a value was given more than once
+        ids = set()
+        for page in iter_pages(session, request_urls, page_size=page_size, parallel=parallel_pages if page_size else parallel, attempts=attempts, timings=timings):
+            for result in page:
+                if result['id'] in ids:
+                    continue
+                ids.add(result['id'])
+                results.append(result)
+
+    return results
+
+
+def get_dataframe(results, metadata_path=None, metadata_keys=None, columns=None):
+    '''
+    The TQC output table for a list of results, optionally annotated with the metadata in `metadata_path`.
+    '''
+    with open_metadata(metadata_path, columns=columns, keys=metadata_keys) if metadata_path else nullcontext() as metadata:
+        df = results_dataframe(results, metadata=metadata, columns=columns)
+    if df is None:
+        # An empty table
+        df = empty_dataframe(columns)
+    return df
+
+
+def get(
+    client, 
+    args, 
+    metadata_path=None, 
+    pag_defaults=None, 
+    parallel=4, 
+    page_size=None, 
+    parallel_pages=4, 
+    use_cache=False, 
+    refresh=False, 
+    cache_dir=None, 
+    ttl=3600, 
+    max_cache_size=1024 ** 3,
+    metadata_keys=None,
+    columns=None,
+    output_format='tsv',
+    output_path=None
+):
+    results = None
+
+    if use_cache:
+        cache = open_cache(cache_dir)
+        query = cache_query(client.url, args, pag_defaults=pag_defaults, columns=columns)
+        # Skip reading from the cache when refreshing, but still write the new results to it
+        if not refresh:
+            with timed(client.timings, 'cache'):
+                results = cache_get(cache, query)
+
+    try:
+        if results is None:
+            try:
+                with timed(client.timings, 'fetch'):
+                    results = client.results(
+                        args, 
+                        pag_defaults=pag_defaults, 
+                        columns=columns, 
+                        page_size=page_size, 
+                        parallel=parallel, 
+                        parallel_pages=parallel_pages
+                    )
+            except ResponseError as e:
+                print_response_error(e.response)
+                return
+
+            if use_cache:
+                with timed(client.timings, 'cache'):
+                    cache_put(cache, query, results, cache_ttl(args, ttl), max_cache_size)
+    finally:
+        if use_cache:
+            cache.close()
+
+    if client.timings is not None:
+        client.timings.rows = len(results)
+    write_results(results, metadata_path=metadata_path, metadata_keys=metadata_keys, columns=columns, output_format=output_format, output_path=output_path, timings=client.timings)
+
+
+def write_results(results, metadata_path=None, metadata_keys=None, columns=None, output_format='tsv', output_path=None, timings=None):
+    '''
+    Write the TQC output table for a list of results.
+
+    Text output without metadata is written a row at a time, without building a DataFrame, so needs no pandas.
+    '''
+    with open_output(output_path, output_format) as out:
+        if metadata_path is None and output_format in ['tsv', 'ndjson']:
+            with timed(timings, 'write'):
+                write_rows(results, out, columns=columns, output_format=output_format)
+        else:
+            with timed(timings, 'build'):
+                df = get_dataframe(results, metadata_path=metadata_path, metadata_keys=metadata_keys, columns=columns)
+            with timed(timings, 'write'):
+                write_dataframe(df, out, output_format)
+
+
+def write_rows(results, out, columns=None, output_format='tsv'):
+    '''
+    Write results to `out` a row at a time, as they are iterated over, as a TSV (with a header) or as NDJSON.
+    '''
+    aliases = column_aliases('get')
+    converters = cell_converters(columns)
+    if output_format == 'ndjson':
+        for result in results:
+            out.write(json.dumps(result_record(result, aliases, columns=columns, converters=converters), separators=(',', ':')) + '\n')
+    else:
+        writer = csv.writer(out, delimiter='\t', lineterminator='\n')
+        writer.writerow(projected_columns(columns))
+        for result in results:
+            writer.writerow(result_row(result, aliases, columns=columns, converters=converters))
+
+
+def get_stream(
+    client, 
+    args, 
+    metadata_path=None, 
+    pag_defaults=None, 
+    page_size=None, 
+    parallel_pages=4, 
+    metadata_keys=None, 
+    columns=None, 
+    output_format='tsv', 
+    output_path=None
+):
+    '''
+    Get data from TQC, writing each row as it is received rather than building the whole table in memory.
+
+    Rows can be written as a TSV or as NDJSON. If `metadata_path` is given, rows are annotated and written in batches.
+    '''
+    if not (output_format in ['tsv', 'ndjson']):
+        raise Exception(f'Cannot pass --format {output_format} with --stream')
+
+    with open_metadata(metadata_path, columns=columns, keys=metadata_keys) if metadata_path else nullcontext() as metadata, open_output(output_path, output_format) as out:
+        results = client.iter_results(args, pag_defaults=pag_defaults, columns=columns, page_size=page_size, parallel_pages=parallel_pages)
+        if client.timings is not None:
+            results = client.timings.count_rows(results)
+
+        # Receiving, decoding and writing rows are interleaved, so are timed together
+        try:
+            with timed(client.timings, 'stream'):
+                if metadata is not None:
+                    # Rows are annotated in batches, so that each lookup in the metadata covers many of them
+                    header = True
+                    batch = []
+                    for result in results:
+                        batch.append(result)
+                        if len(batch) == 10000:
+                            write_dataframe(results_dataframe(batch, metadata=metadata, columns=columns), out, output_format, header=header)
+                            header = False
+                            batch = []
+                    if batch or header:
+                        write_dataframe(results_dataframe(batch, metadata=metadata, columns=columns) if batch else empty_dataframe(columns), out, output_format, header=header)
+
+                else:
+                    write_rows(results, out, columns=columns, output_format=output_format)
+        except ResponseError as e:
+            # Rows received before the error have already been written
+            print_response_error(e.response)
+
+
+def iter_stream_results(url, args, pag_defaults=None, max_url_length=8000, page_size=None, parallel_pages=4, attempts=1, columns=None, session=None, capabilities=None, timings=None):
+    '''
+    Yield the results of a get request as they are received, holding no more than a page (or a single result, if not paginating) at a time.
+
+    Raises a `ResponseError` if the server responds with an error.
+    '''
+    with make_session(parallel_pages) if session is None else nullcontext(session) as session:
+        if capabilities is None:
+            capabilities = server_capabilities(url, session=session)
+        with timed(timings, 'query'):
+            request_urls = query_urls(url, args, capabilities, pag_defaults=pag_defaults, max_url_length=max_url_length, columns=columns)
+
+        # Sub-queries overlap if a value was given more than once
+        ids = set()
+
+        # Pages are bounded in size, so can be yielded a page at a time
+        if page_size and capabilities.get('pagination', False):
+            for page in iter_pages(session, request_urls, page_size=page_size, parallel=parallel_pages, attempts=attempts, timings=timings):
+                for result in page:
+                    if result['id'] in ids:
+                        continue
+                    ids.add(result['id'])
+                    yield result
+            return
+
+        # Otherwise sub-queries are streamed one after the other, so that only one response is held open at a time
+        for request_url in request_urls:
+            with session.get(request_url, stream=True) as response:
+                if not response.ok:
+                    raise ResponseError(response)
+
+                if response.encoding is None:
+                    response.encoding = 'utf-8'
+
+                for result in iter_json_array(response.iter_content(chunk_size=65536, decode_unicode=True)):
+                    if result['id'] in ids:
+                        continue
+                    ids.add(result['id'])
+                    yield result
+
+
+def default_follow_state_path():
+    '''
+    Default location of the state kept between polls by get --follow.
+    '''
+    return f'{default_cache_dir()}/follow.sqlite'
+
+
+def open_follow_state(path=None):
+    '''
+    Open the state kept between polls by get --follow, creating it if it does not exist.
+
+    For each request, the state holds its high-water mark (the latest published_date seen), 
+    the validators of the last response to each of its URLs, and a hash of each row written since the high-water mark.
+    '''
+    if path is None:
+        path = default_follow_state_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    state = sqlite3.connect(path, timeout=30)
+    state.execute('CREATE TABLE IF NOT EXISTS marks (query TEXT PRIMARY KEY, high_water_mark TEXT NOT NULL)')
+    state.execute(
+        'CREATE TABLE IF NOT EXISTS validators ('
+        'query TEXT NOT NULL, '
+        'url TEXT NOT NULL, '
+        'etag TEXT, '
+        'last_modified TEXT, '
+        'PRIMARY KEY (query, url)'
+        ') WITHOUT ROWID'
+    )
+    state.execute(
+        'CREATE TABLE IF NOT EXISTS rows ('
+        'query TEXT NOT NULL, '
+        'id INTEGER NOT NULL, '
+        'published_date TEXT, '
+        'hash TEXT NOT NULL, '
+        'PRIMARY KEY (query, id)'
+        ') WITHOUT ROWID'
+    )
+    return state
+
+
+def published_date_arguments():
+    '''
+    Arguments of a get request that filter on published_date.
+    '''
+    return [
+        'published_date',
+        'published_date_range',
+        'published_iso_week',
+        'published_iso_week_range'
+    ]
+
+
+def poll_changes(client, state, query, args, capabilities, pag_defaults=None, columns=None):
+    '''
+    Poll TQC once for the results of a get request, returning those that are new or have changed since they were last written, with their hashes.
+
+    Each request is conditional on the validators (ETag and Last-Modified) of the last response to the same URL, 
+    so that the server can answer 304 Not Modified, with no body, if nothing has changed.
+
+    Returns the changed results and the validators of the responses. Raises a `ResponseError` if the server responds with an error.
+    '''
+    with timed(client.timings, 'query'):
+        request_urls = query_urls(client.url, copy.deepcopy(args), capabilities, pag_defaults=pag_defaults, max_url_length=client.max_url_length, columns=columns)
+
+    changed = {}
+    validators = {}
+    for request_url in request_urls:
+        previous = state.execute('SELECT etag, last_modified FROM validators WHERE query = ? AND url = ?', (query, request_url)).fetchone()
+        headers = {}
+        if previous is not None:
+            if previous[0]:
+                headers['If-None-Match'] = previous[0]
+            if previous[1]:
+                headers['If-Modified-Since'] = previous[1]
+
+        with timed(client.timings, 'fetch'):
+            response = request_with_backoff(client.session, 'GET', request_url, attempts=client.attempts, backoff=client.backoff, headers=headers)
+
+        # Nothing has changed since the last response, so its validators still hold
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            validators[request_url] = previous
+            continue
+        if not response.ok:
+            raise ResponseError(response)
+        validators[request_url] = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+        with timed(client.timings, 'decode'):
+            results = json.loads(response.text)
+
+        # Sub-queries overlap if a value was given more than once
+        for result in results:
+            if result['id'] in changed:
+                continue
+            digest = payload_hash(result)
+            written = state.execute('SELECT hash FROM rows WHERE query = ? AND id = ?', (query, result['id'])).fetchone()
+            if written is None or written[0] != digest:
+                changed[result['id']] = (result, digest)
+
+    return list(changed.values()), validators
+
+
+def record_poll(state, query, changed, validators, windowed=True):
+    '''
+    Record a poll of get --follow in its state, once the changed results have been written.
+
+    If `windowed`, the high-water mark is moved up to the latest published_date seen, and rows published before it are forgotten, as they are no longer polled.
+    '''
+    state.executemany('INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?)', ((query, result['id'], result.get('published_date'), digest) for result, digest in changed))
+
+    # Validators are only kept for the URLs of the last poll, as those of an earlier window will not be requested again
+    state.execute('DELETE FROM validators WHERE query = ?', (query,))
+    state.executemany('INSERT INTO validators VALUES (?, ?, ?, ?)', ((query, url, etag, last_modified) for url, (etag, last_modified) in validators.items()))
+
+    if windowed:
+        high_water_mark = state.execute('SELECT MAX(published_date) FROM rows WHERE query = ?', (query,)).fetchone()[0]
+        if high_water_mark:
+            state.execute('INSERT OR REPLACE INTO marks VALUES (?, ?)', (query, high_water_mark))
+            state.execute('DELETE FROM rows WHERE query = ? AND published_date < ?', (query, high_water_mark))
+    state.commit()
+
+
+def follow(client, args, pag_defaults=None, columns=None, output_format='tsv', output_path=None, interval=60.0, polls=None, state_path=None):
+    '''
+    Poll TQC for new data every `interval` seconds, writing only the rows that are new or have changed since they were last written, as a TSV or as NDJSON.
+
+    Unless the request filters on published_date, each poll only asks for rows published on or after the high-water mark kept in `state_path`, 
+    which starts at today. Polls continue until `polls` have been made, if given, or until interrupted.
+    '''
+    import requests
+
+    if not (output_format in ['tsv', 'ndjson']):
+        raise Exception(f'Cannot pass --format {output_format} with --follow')
+
+    # The state is kept per request, so that several can be followed at once
+    query = cache_query(client.url, args, pag_defaults=pag_defaults, columns=columns)
+    windowed = all(args.get(x) is None for x in published_date_arguments())
+
+    # The high-water mark needs the published_date of every row, even if it is not written
+    fields = columns
+    if columns and windowed and not ('published_date' in columns):
+        fields = columns + ['published_date']
+
+    aliases = column_aliases('get')
+    converters = cell_converters(columns)
+    capabilities = client.capabilities()
+    state = open_follow_state(state_path)
+    poll = 0
+
+    try:
+        with open_output(output_path, output_format) as out:
+            writer = csv.writer(out, delimiter='\t', lineterminator='\n')
+            if output_format == 'tsv':
+                writer.writerow(projected_columns(columns))
+                out.flush()
+
+            while True:
+                poll_args = args
+                if windowed:
+                    high_water_mark = state.execute('SELECT high_water_mark FROM marks WHERE query = ?', (query,)).fetchone()
+                    today = datetime.today().strftime('%Y-%m-%d')
+                    poll_args = dict(args, published_date_range=[min(high_water_mark[0], today) if high_water_mark else 'today', 'today'])
+
+                # Errors are reported without stopping, as the next poll may succeed
+                try:
+                    changed, validators = poll_changes(client, state, query, poll_args, capabilities, pag_defaults=pag_defaults, columns=fields)
+                except ResponseError as e:
+                    print_response_error(e.response, file=sys.stderr)
+                except requests.ConnectionError as e:
+                    print(e, file=sys.stderr)
+                else:
+                    # Rows are written before the poll is recorded, so none are lost if interrupted in between
+                    with timed(client.timings, 'write'):
+                        for result, _ in changed:
+                            if output_format == 'ndjson':
+                                out.write(json.dumps(result_record(result, aliases, columns=columns, converters=converters), separators=(',', ':')) + '\n')
+                            else:
+                                writer.writerow(result_row(result, aliases, columns=columns, converters=converters))
+                        out.flush()
+                    record_poll(state, query, changed, validators, windowed=windowed)
+                    if client.timings is not None:
+                        client.timings.rows = (client.timings.rows or 0) + len(changed)
+
+                poll += 1
+                if polls is not None and poll >= polls:
+                    break
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state.close()
+
+
+def default_replica_path():
+    '''
+    Default location of the local replica of TQC.
+    '''
+    return f'{default_cache_dir()}/replica.sqlite'
+
+
+def replica_columns():
+    '''
+    Columns of the local replica, named as they are by the server.
+    '''
+    return ['id'] + [column_aliases('add').get(x, x) for x in returned_get_columns()]
+
+
+def replica_indexed_columns():
+    '''
+    Columns of the local replica with an index, for fast filtering.
+    '''
+    return [
+        'central_sample_id',
+        'run_name',
+        'pag_name',
+        'sequencing_org_code',
+        'library_primers',
+        'collection_date',
+        'received_date',
+        'sequencing_org_received_date',
+        'sequencing_submission_date',
+        'published_date',
+    ]
+
+
+def sql_operators():
+    '''
+    SQL equivalents of the operators on numeric fields in TQC.
+    '''
+    return {
+        'lt' : '<',
+        'gt' : '>',
+        'leq' : '<=',
+        'geq' : '>=',
+        'eq' : '=',
+        'neq' : '!='
+    }
+
+
+def open_replica(path=None):
+    '''
+    Open the local replica of TQC, creating it if it does not exist.
+    '''
+    if path is None:
+        path = default_replica_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    replica = sqlite3.connect(path, timeout=30)
+    replica.row_factory = sqlite3.Row
+
+    columns = []
+    for x in replica_columns():
+        if x == 'id':
+            columns.append('id INTEGER PRIMARY KEY')
+        # Numeric columns have no type affinity, so that ints and floats are stored exactly as they were received
+        elif x in numeric_columns():
+            columns.append(f'"{x}"')
+        else:
+            columns.append(f'"{x}" TEXT')
+    replica.execute(f'CREATE TABLE IF NOT EXISTS results ({", ".join(columns)})')
+    for x in replica_indexed_columns():
+        replica.execute(f'CREATE INDEX IF NOT EXISTS "results_{x}" ON results ("{x}")')
+    replica.execute('CREATE INDEX IF NOT EXISTS results_pag ON results (pag_suppressed, pag_basic_qc)')
+    replica.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    return replica
+
+
+def sync(client, replica_path=None, full=False, page_size=None, parallel_pages=4):
+    start = time.time()
+    synced = 0
+
+    replica = open_replica(replica_path)
+    try:
+        # Data is added to TQC by published_date, so only the days from the last one already in the replica need pulling
+        # The last day is pulled again, as it may have been added to since
+        high_water_mark = replica.execute("SELECT value FROM meta WHERE name = 'high_water_mark'").fetchone()
+        if full or high_water_mark is None:
+            replica.execute('DELETE FROM results')
+            args = {}
+        else:
+            args = {'published_date_range' : [high_water_mark[0], 'today']}
+
+        columns = replica_columns()
+        insert = f'INSERT OR REPLACE INTO results VALUES ({", ".join("?" for _ in columns)})'
+
+        capabilities = client.capabilities()
+        with timed(client.timings, 'query'):
+            request_urls = query_urls(client.url, args, capabilities, pag_defaults=False)
+
+        # Paginate if the server supports it
+        if not capabilities.get('pagination', False):
+            page_size = None
+
+        try:
+            for page in iter_pages(client.session, request_urls, page_size=page_size, parallel=parallel_pages, attempts=client.attempts, backoff=client.backoff, timings=client.timings):
+                with timed(client.timings, 'insert'):
+                    replica.executemany(insert, ([flatten_result(result).get(x) for x in columns] for result in page))
+                synced += len(page)
+                if client.timings is not None:
+                    client.timings.rows = synced
+        except ResponseError as e:
+            # Nothing is committed, so the replica is left as it was before the sync
+            print_response_error(e.response)
+            replica.rollback()
+            return
+
+        high_water_mark = replica.execute('SELECT MAX(published_date) FROM results').fetchone()[0]
+        if high_water_mark:
+            replica.execute("INSERT OR REPLACE INTO meta VALUES ('high_water_mark', ?)", (high_water_mark,))
+        replica.execute("INSERT OR REPLACE INTO meta VALUES ('synced', ?)", (datetime.today().strftime('%Y-%m-%d %H:%M:%S'),))
+        replica.commit()
+        total = replica.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+    finally:
+        replica.close()
+
+    end = time.time()
+
+    print('[SYNC]')
+    print(f'Pulled: {synced}')
+    print(f'Total: {total}')
+    print(f'High-water mark: {high_water_mark}')
+    print('[TIME]')
+    print(f'{int((end - start) // 60)} m {round((end - start) % 60, 2)} s')
+
+
+def offline_query(args, pag_defaults=None, columns=None):
+    '''
+    Compile the filters of a get request into an SQL query on the local replica, matching the same rows as the server would.
+
+    If `columns` are given, only their fields are selected.
+
+    Returns the query and its parameters.
+    '''
+    # Filters are compiled in the same way as for the server, with date ranges kept as ranges
+    params = make_query_params(args, pag_defaults=pag_defaults, ranges=True)
+
+    fields = {}
+    if params:
+        for param in params.split('&'):
+            field, value = param.split('=', 1)
+            fields.setdefault(field, []).append(value)
+
+    clauses = []
+    values = []
+    for field, field_values in fields.items():
+        if not (field in replica_columns()):
+            raise Exception(f"Cannot filter on unknown field '{field}'")
+
+        # Values for numeric fields are AND'd together
+        if field in numeric_columns():
+            for value in field_values:
+                operator, num = value.split('_', 1)
+                clauses.append(f'"{field}" {sql_operators()[operator.lower()]} ?')
+                values.append(float(num))
+
+        # Values for all other fields are OR'd together
+        else:
+            matches = []
+            for value in field_values:
+                if field in date_columns() and value.startswith('range_'):
+                    _, start_date, end_date = value.split('_')
+                    matches.append(f'"{field}" BETWEEN ? AND ?')
+                    values.extend([start_date, end_date])
+                elif value == '':
+                    matches.append(f'("{field}" = \'\' OR "{field}" IS NULL)')
+                else:
+                    matches.append(f'"{field}" = ?')
+                    values.append(value)
+            clauses.append('(' + ' OR '.join(matches) + ')')
+
+    if columns:
+        query = 'SELECT ' + ', '.join(f'"{x}"' for x in projection_fields(columns)) + ' FROM results'
+    else:
+        query = 'SELECT * FROM results'
+    if clauses:
+        query += ' WHERE ' + ' AND '.join(clauses)
+    return query + ' ORDER BY id', values
+
+
+def get_offline(args, replica_path=None, metadata_path=None, pag_defaults=None, metadata_keys=None, columns=None, output_format='tsv', output_path=None, timings=None):
+    '''
+    Get data from the local replica of TQC, kept up to date by `sync`.
+    '''
+    if replica_path is None:
+        replica_path = default_replica_path()
+
+    if not os.path.isfile(replica_path):
+        raise Exception(f"Replica '{replica_path}' does not exist. Run 'tqc.py sync' first")
+
+    replica = open_replica(replica_path)
+    try:
+        with timed(timings, 'query'):
+            query, values = offline_query(args, pag_defaults=pag_defaults, columns=columns)
+        with timed(timings, 'read'):
+            results = [dict(row) for row in replica.execute(query, values)]
+    finally:
+        replica.close()
+
+    if timings is not None:
+        timings.rows = len(results)
+    write_results(results, metadata_path=metadata_path, metadata_keys=metadata_keys, columns=columns, output_format=output_format, output_path=output_path, timings=timings)
+
+
+def read_ids(ids_path):
+    '''
+    Stream central_sample_ids from a file (or stdin, if `ids_path` is '-') with one ID per line.
+
+    Blank lines, repeated IDs and a `central_sample_id` header line are skipped.
+    '''
+    ids_file = sys.stdin if ids_path == '-' else open(ids_path)
+    try:
+        seen = set()
+        for line in ids_file:
+            central_sample_id = line.strip()
+            if not central_sample_id or central_sample_id == 'central_sample_id' or central_sample_id in seen:
+                continue
+            seen.add(central_sample_id)
+            yield central_sample_id
+    finally:
+        if ids_file is not sys.stdin:
+            ids_file.close()
+
+
+def batch_ids(ids, prefix_length, max_url_length):
+    '''
+    Group IDs into batches whose `central_sample_id` parameters fit within a URL of `max_url_length`, after a prefix of `prefix_length`.
+    '''
+    batch = []
+    length = prefix_length
+    for central_sample_id in ids:
+        param_length = len(f'&central_sample_id={central_sample_id}')
+        if prefix_length + param_length > max_url_length:
+            raise Exception(f"central_sample_id '{central_sample_id}' does not fit within a URL of {max_url_length} characters")
+        if length + param_length > max_url_length:
+            yield batch
+            batch = []
+            length = prefix_length
+        batch.append(central_sample_id)
+        length += param_length
+    if batch:
+        yield batch
+
+
+def get_ids(client, args, ids_path, metadata_path=None, pag_defaults=None, parallel=4, metadata_keys=None, columns=None, output_format='tsv', output_path=None):
+    '''
+    Get data for the central_sample_ids in `ids_path`, filtered by `args`, writing the results for each batch of IDs as it arrives.
+
+    Results for binary formats are written once all batches have arrived.
+    '''
+    with open_metadata(metadata_path, columns=columns, keys=metadata_keys) if metadata_path else nullcontext() as metadata, open_output(output_path, output_format) as out:
+        get_ids_rows(
+            client.url, 
+            args, 
+            ids_path, 
+            out, 
+            metadata=metadata, 
+            pag_defaults=pag_defaults, 
+            max_url_length=client.max_url_length, 
+            parallel=parallel, 
+            columns=columns, 
+            output_format=output_format, 
+            session=client.session, 
+            capabilities=client.capabilities(), 
+            timings=client.timings
+        )
+
+
+def get_ids_rows(url, args, ids_path, out, metadata=None, pag_defaults=None, max_url_length=8000, parallel=4, columns=None, output_format='tsv', session=None, capabilities=None, timings=None):
+    import pandas as pd
+    request_url = f'{url}/get/?'
+    header = False
+    frames = []
+
+    with make_session(parallel) if session is None else nullcontext(session) as session, ThreadPoolExecutor(max_workers=parallel) as executor:
+        if capabilities is None:
+            capabilities = server_capabilities(url, session=session)
+        # Compile date ranges into single parameters if the server can evaluate them, rather than one parameter per day
+        params = make_query_params(args, pag_defaults=pag_defaults, ranges=capabilities.get('range_filters', False))
+        if columns and capabilities.get('projection', False):
+            params = '&'.join(filter(None, [params, 'fields=' + ','.join(projection_fields(columns))]))
+        if params:
+            request_url += params + '&'
+
+        def fetch(batch):
+            return session.get(request_url + '&'.join(f'central_sample_id={x}' for x in batch))
+
+        # Wait on requests in flight until no more than `limit` remain, printing each batch's results as they arrive
+        def drain(limit):
+            nonlocal header
+            while len(pending) > limit:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    response = future.result()
+                    if not response.ok:
+                        print_response_error(response)
+                        return False
+
+                    with timed(timings, 'decode'):
+                        results = json.loads(response.text)
+                    with timed(timings, 'build'):
+                        df = results_dataframe(results, metadata=metadata, columns=columns)
+                    if df is not None:
+                        if timings is not None:
+                            timings.rows = (timings.rows or 0) + len(df)
+                        if output_format in binary_formats():
+                            frames.append(df)
+                        else:
+                            write_dataframe(df, out, output_format, header=not header)
+                        header = True
+            return True
+
+        pending = set()
+        for batch in batch_ids(read_ids(ids_path), len(request_url), max_url_length):
+            pending.add(executor.submit(fetch, batch))
+            # Stop reading IDs until a slot frees up
+            if not drain(2 * parallel - 1):
+                return
+
+        if not drain(0):
+            return
+
+    if frames:
+        write_dataframe(pd.concat(frames, ignore_index=True), out, output_format)
+    elif not header:
+        # Write an empty table
+        write_dataframe(empty_dataframe(columns), out, output_format)
+
+
+def tile_matrix(vectors, tile_n):
+    '''
+    Decode tile_vectors (without their brackets) that each hold `tile_n` median coverages into a matrix of samples by tiles.
+    '''
+    import numpy as np
+    # All vectors are parsed in a single pass, rather than one at a time
+    # Parsed as floats, and downcast below if they are all whole numbers
+    values = np.array(','.join(vectors).split(','), dtype='float64')
+
+    if values.size != len(vectors) * tile_n:
+        raise Exception(f'Failed to decode tile_vector for tile_n {tile_n}')
+    matrix = values.reshape(len(vectors), tile_n)
+
+    # Coverages are held as the smallest unsigned integers that fit them, where they can be
+    if np.all(matrix % 1 == 0) and matrix.min(initial=0) >= 0:
+        for dtype in ['uint16', 'uint32']:
+            if matrix.max(initial=0) <= np.iinfo(dtype).max:
+                return matrix.astype(dtype)
+    return matrix.astype('float32')
+
+
+def is_numeric_vector(vector):
+    '''
+    Whether every value in a tile_vector (without its brackets) is a number.
+    '''
+    import numpy as np
+    try:
+        np.array(vector.split(','), dtype='float64')
+    except ValueError:
+        return False
+    return True
+
+
+def decode_tile_vectors(df):
+    '''
+    Decode the tile_vector column of the TQC output table into a matrix of samples by tiles, for each primer scheme.
+
+    Returns a dictionary of `(library_primers, tile_n)` to the labels of the samples in it (their pag_name or central_sample_id) and its matrix.
+    Samples whose tile_vector is missing, holds anything other than numbers, or does not hold `tile_n` values, are left out.
+    '''
+    import pandas as pd
+    tile_n = pd.to_numeric(df['tile_n'], errors='coerce')
+    vectors = df['tile_vector'].astype('string').fillna('').str.strip('[] ')
+    decodable = ((vectors != '') & (tile_n > 0) & (vectors.str.count(',') + 1 == tile_n)).astype(bool)
+
+    for x in ['pag_name', 'central_sample_id']:
+        if x in df.columns:
+            labels = df[x].astype('string').fillna('')
+            break
+    else:
+        labels = pd.Series(df.index.astype(str), index=df.index)
+
+    samples = pd.DataFrame({
+        'library_primers' : df['library_primers'].astype('string').fillna(''),
+        'tile_n' : tile_n,
+        'tile_vector' : vectors,
+        'label' : labels
+    })[decodable]
+
+    matrices = {}
+    for (scheme, n), group in samples.groupby(['library_primers', 'tile_n'], sort=True):
+        labels = group['label'].to_numpy(dtype=str)
+        vectors = group['tile_vector'].tolist()
+        try:
+            matrix = tile_matrix(vectors, int(n))
+        except ValueError:
+            # A value that is not a number fails the whole scheme, so its vectors are checked one at a time to leave out those that hold one
+            numeric = [is_numeric_vector(vector) for vector in vectors]
+            labels = labels[numeric]
+            vectors = [vector for vector, ok in zip(vectors, numeric) if ok]
+            if not vectors:
+                continue
+            matrix = tile_matrix(vectors, int(n))
+        matrices[(scheme, int(n))] = (labels, matrix)
+    return matrices
+
+
+def read_tile_table(input_path):
+    '''
+    Read the columns needed for tile analysis from a TQC output table (or stdin, if `input_path` is '-'), as written by get.
+    '''
+    import pandas as pd
+    needed = ['pag_name', 'central_sample_id', 'library_primers', 'tile_n', 'tile_vector']
+    df = pd.read_csv(sys.stdin if input_path == '-' else input_path, sep='\t', usecols=lambda x: x in needed, dtype=str, keep_default_na=False)
+    for x in ['library_primers', 'tile_n', 'tile_vector']:
+        if not (x in df.columns):
+            raise Exception(f"Input has no '{x}' column")
+    return df
+
+
+def tiles(input_path, output_dir='tiles', threshold=20.0):
+    import numpy as np
+    import pandas as pd
+    start = time.time()
+
+    df = read_tile_table(input_path)
+    matrices = decode_tile_vectors(df)
+    os.makedirs(output_dir, exist_ok=True)
+
+    tile_tables = []
+    sample_tables = []
+    scheme_rows = []
+    for (scheme, tile_n), (labels, matrix) in matrices.items():
+        # A tile has dropped out of a sample if its median coverage is below the threshold
+        dropouts = matrix < threshold
+        tile_rates = dropouts.mean(axis=0)
+        sample_counts = dropouts.sum(axis=1)
+
+        name = ''.join(c if c.isalnum() or c in '.-' else '_' for c in scheme) or 'unknown'
+        np.savez(
+            f'{output_dir}/tiles.{name}.{tile_n}.npz', 
+            samples=labels, 
+            coverage=matrix, 
+            sample_dropouts=sample_counts.astype('int32'), 
+            tile_dropout_rates=tile_rates.astype('float32')
+        )
+
+        tile_tables.append(pd.DataFrame({
+            'library_primers' : scheme,
+            'tile_n' : tile_n,
+            'tile' : np.arange(1, tile_n + 1),
+            'samples' : len(labels),
+            'dropouts' : dropouts.sum(axis=0),
+            'dropout_rate' : tile_rates.round(4),
+            'median_coverage' : np.median(matrix, axis=0)
+        }))
+        sample_tables.append(pd.DataFrame({
+            'sample' : labels,
+            'library_primers' : scheme,
+            'tile_n' : tile_n,
+            'dropouts' : sample_counts,
+            'pc_dropouts' : (100 * sample_counts / tile_n).round(2)
+        }))
+        worst = int(tile_rates.argmax())
+        scheme_rows.append({
+            'library_primers' : scheme,
+            'tile_n' : tile_n,
+            'samples' : len(labels),
+            'mean_dropouts' : round(float(sample_counts.mean()), 2),
+            'median_dropouts' : float(np.median(sample_counts)),
+            'pc_samples_with_dropouts' : round(100 * float((sample_counts > 0).mean()), 2),
+            'worst_tile' : worst + 1,
+            'worst_tile_dropout_rate' : round(float(tile_rates[worst]), 4)
+        })
+
+    schemes = pd.DataFrame(scheme_rows, columns=['library_primers', 'tile_n', 'samples', 'mean_dropouts', 'median_dropouts', 'pc_samples_with_dropouts', 'worst_tile', 'worst_tile_dropout_rate'])
+    schemes.to_csv(f'{output_dir}/schemes.tsv', sep='\t', index=False)
+    if tile_tables:
+        pd.concat(tile_tables, ignore_index=True).to_csv(f'{output_dir}/tile_dropouts.tsv', sep='\t', index=False)
+        pd.concat(sample_tables, ignore_index=True).to_csv(f'{output_dir}/sample_dropouts.tsv', sep='\t', index=False)
+
+    end = time.time()
+
+    decoded = int(schemes['samples'].sum())
+    print('[TILES]')
+    print(f'Samples: {decoded}')
+    print(f'Skipped: {len(df) - decoded}')
+    print(f'Dropout threshold: {threshold}')
+    print('[SCHEMES]')
+    print(schemes.to_csv(sep='\t', index=False), end='')
+    print('[OUTPUT]')
+    print(f'Path: {os.path.abspath(output_dir)}')
+    print('[TIME]')
+    print(f'{int((end - start) // 60)} m {round((end - start) % 60, 2)} s')
+
+
+def iso_week_columns():
+    '''
+    Columns that stats can group by, holding the ISO week (YYYY-WW) of a date column of the TQC output table.
+    '''
+    return {x[:-len('_date')] + '_iso_week' : x for x in date_columns()}
+
+
+def parse_aggregation(spec):
+    '''
+    Parse an aggregation for stats, one of: `count`, `FUNC:COLUMN` or `rate:COLUMN=VALUE`.
+
+    FUNC is one of mean, sum, min, max, std, median or qN (the Nth percentile, e.g. q90), on a numeric column.
+    A rate is the fraction of rows whose COLUMN is VALUE.
+    '''
+    if spec == 'count':
+        return {'spec' : spec, 'name' : 'count', 'func' : 'count', 'column' : None}
+
+    func, _, column = spec.partition(':')
+    if func == 'rate':
+        column, _, value = column.partition('=')
+        if not (column in returned_get_columns()):
+            raise Exception(f"Invalid aggregation '{spec}': '{column}' is not a column")
+        return {'spec' : spec, 'name' : f'rate_{column}_{value}', 'func' : 'rate', 'column' : column, 'value' : value}
+
+    if func in ['mean', 'sum', 'min', 'max', 'std', 'median']:
+        quantile = 0.5 if func == 'median' else None
+    elif func.startswith('q'):
+        try:
+            quantile = float(func[1:]) / 100
+        except ValueError:
+            quantile = None
+        if quantile is None or not (0 <= quantile <= 1):
+            raise Exception(f"Invalid aggregation '{spec}': percentiles are given as q0 to q100")
+    else:
+        raise Exception(f"Invalid aggregation '{spec}'. Aggregations are count, FUNC:COLUMN or rate:COLUMN=VALUE")
+
+    if not (column in numeric_columns()):
+        raise Exception(f"Invalid aggregation '{spec}': '{column}' is not a numeric column")
+    return {'spec' : spec, 'name' : f'{func}_{column}', 'func' : func, 'column' : column, 'quantile' : quantile}
+
+
+def stats_columns(group_by, aggregations):
+    '''
+    Columns of the TQC output table needed to compute `aggregations` over groups of `group_by`.
+    '''
+    columns = [iso_week_columns().get(x, x) for x in group_by]
+    columns += [aggregation['column'] for aggregation in aggregations if aggregation['column']]
+    return projected_columns(columns) if columns else ['central_sample_id']
+
+
+def group_keys(df, group_by):
+    '''
+    Values of the `group_by` columns of the TQC output table as strings, as they are written out.
+    '''
+    import pandas as pd
+    keys = {}
+    for x in group_by:
+        if x in iso_week_columns():
+            keys[x] = df[iso_week_columns()[x]].dt.strftime('%G-%V')
+        elif pd.api.types.is_datetime64_any_dtype(df[x]):
+            keys[x] = df[x].dt.strftime('%Y-%m-%d')
+        else:
+            keys[x] = df[x].astype('string')
+    # Rows are all in one group if there is nothing to group by
+    if not group_by:
+        keys[''] = pd.Series('', index=df.index)
+    return pd.DataFrame(keys, index=df.index).fillna('')
+
+
+def partial_aggregates(df, group_by, aggregations):
+    '''
+    Aggregate a chunk of the TQC output table into partial results, that can be combined with those of other chunks.
+
+    Returns the partial sums, counts, minimums and maximums for each group, and the values needed for any quantiles.
+    '''
+    import numpy as np
+    import pandas as pd
+    keys = group_keys(df, group_by)
+    parts = {'count' : np.ones(len(df), dtype='int64')}
+    how = {'count' : 'sum'}
+    values = {}
+
+    for aggregation in aggregations:
+        func = aggregation['func']
+        column = aggregation['column']
+
+        if func == 'rate':
+            parts[aggregation['name']] = (df[column].astype('string').fillna('') == aggregation['value']).to_numpy(dtype='int64')
+            how[aggregation['name']] = 'sum'
+            continue
+        elif func == 'count':
+            continue
+
+        # Single-precision floats are widened through their decimal representation, so that chunks give the same results however they were typed
+        if df[column].dtype == 'float32':
+            cells = df[column].astype(str).astype('float64').to_numpy()
+        else:
+            cells = df[column].to_numpy(dtype='float64', na_value=np.nan)
+        if aggregation['quantile'] is not None:
+            values[column] = cells
+        elif func in ['min', 'max']:
+            parts[f'{func} {column}'] = cells
+            how[f'{func} {column}'] = func
+        else:
+            # Means, sums and standard deviations all follow from these
+            present = ~np.isnan(cells)
+            parts[f'n {column}'] = present.astype('int64')
+            parts[f'sum {column}'] = np.where(present, cells, 0.0)
+            parts[f'sumsq {column}'] = np.where(present, cells, 0.0) ** 2
+            how.update({f'n {column}' : 'sum', f'sum {column}' : 'sum', f'sumsq {column}' : 'sum'})
+
+    frame = pd.concat([keys, pd.DataFrame(parts, index=df.index)], axis=1)
+    partial = frame.groupby(list(keys.columns), sort=False).agg(how)
+    quantile_values = pd.concat([keys, pd.DataFrame(values, index=df.index)], axis=1) if values else None
+    return partial, quantile_values
+
+
+def combine_aggregates(partials, quantile_values, group_by, aggregations):
+    '''
+    Combine the partial results of each chunk into the final table of aggregations for each group.
+    '''
+    import numpy as np
+    import pandas as pd
+    key_columns = group_by or ['']
+    if not partials:
+        return pd.DataFrame(columns=group_by + [aggregation['name'] for aggregation in aggregations])
+
+    partial = pd.concat(partials)
+    how = {x : ('sum' if x.split(' ')[0] in ['count', 'n', 'sum', 'sumsq'] or x.startswith('rate_') else x.split(' ')[0]) for x in partial.columns}
+    partial = partial.groupby(level=key_columns, sort=True).agg(how)
+
+    quantiles = None
+    if quantile_values:
+        quantiles = pd.concat(quantile_values).groupby(key_columns, sort=True)
+
+    table = pd.DataFrame(index=partial.index)
+    for aggregation in aggregations:
+        func = aggregation['func']
+        column = aggregation['column']
+        name = aggregation['name']
+
+        if func == 'count':
+            table[name] = partial['count']
+        elif func == 'rate':
+            table[name] = (partial[name] / partial['count']).round(4)
+        elif aggregation['quantile'] is not None:
+            table[name] = quantiles[column].quantile(aggregation['quantile']).round(4)
+        elif func in ['min', 'max']:
+            table[name] = partial[f'{func} {column}']
+        else:
+            n = partial[f'n {column}']
+            total = partial[f'sum {column}']
+            if func == 'sum':
+                table[name] = total.where(n > 0).round(4)
+            elif func == 'mean':
+                table[name] = (total / n.where(n > 0)).round(4)
+            else:
+                # Sample standard deviation
+                variance = (partial[f'sumsq {column}'] - total ** 2 / n.where(n > 0)) / (n - 1).where(n > 1)
+                table[name] = np.sqrt(variance.clip(lower=0)).round(4)
+
+    # Integer columns keep their type through sums, minimums and maximums
+    for aggregation in aggregations:
+        if aggregation['func'] in ['sum', 'min', 'max'] and aggregation['column'] in integer_columns():
+            table[aggregation['name']] = table[aggregation['name']].astype('Int64')
+
+    table = table.reset_index()
+    if not group_by:
+        table = table.drop(columns=[''])
+    return table
+
+
+def stats_url(url, args, capabilities, group_by, aggregations, pag_defaults=None, max_url_length=8000):
+    '''
+    URL for the server to compute the aggregations itself, or `None` if it does not support them or the query would need splitting up.
+    '''
+    if not capabilities.get('aggregation', False):
+        return None
+
+    params = make_query_params(args, pag_defaults=pag_defaults, ranges=capabilities.get('range_filters', False))
+    params = [params] if params else []
+    if group_by:
+        params.append('group_by=' + ','.join(group_by))
+    params.extend('agg=' + quote(aggregation['spec']) for aggregation in aggregations)
+
+    request_url = f'{url}/stats/?' + '&'.join(params)
+    if len(request_url) > max_url_length:
+        return None
+    return request_url
+
+
+def iter_stats_chunks(url, args, columns, chunk_size=50000, pag_defaults=None, max_url_length=8000, page_size=None, parallel_pages=4, attempts=1, offline=False, replica_path=None, session=None, capabilities=None, timings=None):
+    '''
+    Yield the results of a get request in chunks of up to `chunk_size`, from TQC or from the local replica.
+    '''
+    if offline:
+        if replica_path is None:
+            replica_path = default_replica_path()
+        if not os.path.isfile(replica_path):
+            raise Exception(f"Replica '{replica_path}' does not exist. Run 'tqc.py sync' first")
+
+        replica = open_replica(replica_path)
+        try:
+            query, values = offline_query(args, pag_defaults=pag_defaults, columns=columns)
+            cursor = replica.execute(query, values)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [dict(row) for row in rows]
+        finally:
+            replica.close()
+        return
+
+    chunk = []
+    for result in iter_stream_results(
+        url, 
+        args, 
+        pag_defaults=pag_defaults, 
+        max_url_length=max_url_length, 
+        page_size=page_size, 
+        parallel_pages=parallel_pages, 
+        attempts=attempts, 
+        columns=columns, 
+        session=session, 
+        capabilities=capabilities, 
+        timings=timings
+    ):
+        chunk.append(result)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stats_table(
+    url, 
+    args, 
+    group_by=None, 
+    aggregations=None, 
+    pag_defaults=None, 
+    max_url_length=8000, 
+    page_size=None, 
+    parallel_pages=4, 
+    attempts=1, 
+    chunk_size=50000, 
+    offline=False, 
+    replica_path=None, 
+    session=None, 
+    capabilities=None, 
+    timings=None
+):
+    '''
+    Aggregations over groups of the data in TQC, as a DataFrame with a row per group.
+
+    The server computes them if it supports it. Otherwise results are fetched (only the columns needed) and aggregated a chunk at a time.
+    Raises a `ResponseError` if the server responds with an error.
+    '''
+    import pandas as pd
+    import requests
+    group_by = group_by or []
+    for x in group_by:
+        if not (x in returned_get_columns() or x in iso_week_columns()):
+            raise Exception(f"Cannot group by unknown column '{x}'")
+    aggregations = [parse_aggregation(spec) for spec in aggregations or ['count']]
+    columns = stats_columns(group_by, aggregations)
+
+    if not offline:
+        if capabilities is None:
+            capabilities = server_capabilities(url, session=session)
+        request_url = stats_url(url, args, capabilities, group_by, aggregations, pag_defaults=pag_defaults, max_url_length=max_url_length)
+        if request_url:
+            response = request_with_backoff(session or requests, 'GET', request_url, attempts=attempts, backoff=1.0)
+            if not response.ok:
+                raise ResponseError(response)
+            names = group_by + [aggregation['name'] for aggregation in aggregations]
+            with timed(timings, 'decode'):
+                return pd.DataFrame(json.loads(response.text), columns=names)
+
+    partials = []
+    quantile_values = []
+    for chunk in iter_stats_chunks(
+        url, 
+        args, 
+        columns, 
+        chunk_size=chunk_size, 
+        pag_defaults=pag_defaults, 
+        max_url_length=max_url_length, 
+        page_size=page_size, 
+        parallel_pages=parallel_pages, 
+        attempts=attempts, 
+        offline=offline, 
+        replica_path=replica_path, 
+        session=session, 
+        capabilities=capabilities, 
+        timings=timings
+    ):
+        if timings is not None:
+            timings.rows = (timings.rows or 0) + len(chunk)
+        with timed(timings, 'build'):
+            df = results_dataframe(chunk, columns=columns)
+        with timed(timings, 'aggregate'):
+            partial, values = partial_aggregates(df, group_by, aggregations)
+        partials.append(partial)
+        if values is not None:
+            quantile_values.append(values)
+    with timed(timings, 'aggregate'):
+        return combine_aggregates(partials, quantile_values, group_by, aggregations)
+
+
+def stats(
+    client, 
+    args, 
+    group_by=None, 
+    aggregations=None, 
+    pag_defaults=None, 
+    page_size=None, 
+    parallel_pages=4, 
+    chunk_size=50000, 
+    offline=False, 
+    replica_path=None, 
+    output_format='tsv', 
+    output_path=None
+):
+    '''
+    Compute aggregations over groups of the data in TQC, without writing out the data itself.
+    '''
+    try:
+        with timed(client.timings, 'stats'):
+            table = client.stats(
+                args, 
+                group_by=group_by, 
+                aggregations=aggregations, 
+                pag_defaults=pag_defaults, 
+                page_size=page_size, 
+                parallel_pages=parallel_pages, 
+                chunk_size=chunk_size, 
+                offline=offline, 
+                replica_path=replica_path
+            )
+    except ResponseError as e:
+        print_response_error(e.response)
+        return
+
+    with timed(client.timings, 'write'), open_output(output_path, output_format) as out:
+        write_dataframe(table, out, output_format)
+
+
+def timed(timings, phase):
+    '''
+    Context manager adding the time spent in its block to `phase` of `timings`, or doing nothing if `timings` is `None`.
+    '''
+    return timings.phase(phase) if timings is not None else nullcontext()
+
+
+def latency_buckets():
+    '''
+    Upper bounds (in milliseconds) of the buckets of the request latency histogram.
+    '''
+    return [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+def percentile(values, q):
+    '''
+    The `q`th percentile of sorted `values`, by the nearest-rank method.
+    '''
+    if not values:
+        return None
+    return values[max(int(-(-q * len(values) // 100)) - 1, 0)]
+
+
+class Timings:
+    '''
+    Durations of the phases of a command, and the latencies, statuses and sizes of the HTTP requests it made.
+
+    Phases run on worker threads (e.g. `decode`) are summed over the threads, so can add up to more than the total.
+    '''
+    def __init__(self, command=None):
+        self.command = command
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.latencies = []
+        self.statuses = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.rows = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def record_response(self, response, *args, **kwargs):
+        '''
+        Response hook for a session, recording the time each request took to be answered (up to the end of its headers), its status and its size.
+
+        The hook runs before the body is read, so the body is counted (after any decompression) as it is read, rather than taken from its Content-Length.
+        '''
+        body = response.request.body
+        with self.lock:
+            self.latencies.append(response.elapsed.total_seconds() * 1000)
+            self.statuses[response.status_code] = self.statuses.get(response.status_code, 0) + 1
+            self.bytes_sent += len(body) if body else 0
+
+        stream = response.raw.stream
+
+        def counted_stream(*args, **kwargs):
+            for chunk in stream(*args, **kwargs):
+                with self.lock:
+                    self.bytes_received += len(chunk)
+                yield chunk
+
+        response.raw.stream = counted_stream
+
+    def count_rows(self, results):
+        '''
+        Pass through an iterable of results, counting them as rows.
+        '''
+        self.rows = self.rows or 0
+        for result in results:
+            self.rows += 1
+            yield result
+
+    def summary(self):
+        total = time.perf_counter() - self.start
+        latencies = sorted(self.latencies)
+
+        histogram = {}
+        remaining = latencies
+        for bound in latency_buckets():
+            within = [x for x in remaining if x <= bound]
+            histogram[f'<={bound}'] = len(within)
+            remaining = remaining[len(within):]
+        histogram[f'>{latency_buckets()[-1]}'] = len(remaining)
+
+        return {
+            'command' : self.command,
+            'total_s' : round(total, 4),
+            'phases_s' : {name : round(seconds, 4) for name, seconds in self.phases.items()},
+            'requests' : len(latencies),
+            'statuses' : {str(status) : count for status, count in sorted(self.statuses.items())},
+            'bytes_sent' : self.bytes_sent,
+            'bytes_received' : self.bytes_received,
+            'latency_ms' : {
+                'p50' : round(percentile(latencies, 50), 3) if latencies else None,
+                'p95' : round(percentile(latencies, 95), 3) if latencies else None,
+                'p99' : round(percentile(latencies, 99), 3) if latencies else None,
+                'max' : round(latencies[-1], 3) if latencies else None,
+                'histogram' : histogram,
+            },
+            'rows' : self.rows,
+            'rows_per_s' : round(self.rows / total, 1) if self.rows is not None and total else None,
+        }
+
+    def report(self, print_timings=True, json_path=None):
+        '''
+        Print the summary of the timings to stderr, so as not to mix with output on stdout, and/or write it to `json_path` as JSON.
+        '''
+        summary = self.summary()
+
+        if json_path:
+            with open(json_path, 'w') as metrics:
+                json.dump(summary, metrics, indent=4)
+                metrics.write('\n')
+
+        if print_timings:
+            def show(*lines):
+                for line in lines:
+                    print(line, file=sys.stderr)
+
+            show('[TIMINGS]')
+            show(*(f'{name}: {seconds:.4f} s' for name, seconds in summary['phases_s'].items()))
+            show(f'Total: {summary["total_s"]:.4f} s')
+            show('[REQUESTS]')
+            show(f'Requests: {summary["requests"]}')
+            show(f'Statuses: {", ".join(f"{status}: {count}" for status, count in summary["statuses"].items()) or "-"}')
+            show(f'Sent: {summary["bytes_sent"]} bytes')
+            show(f'Received: {summary["bytes_received"]} bytes')
+            if summary['requests']:
+                latency = summary['latency_ms']
+                show(f'Latency: p50 {latency["p50"]:.1f} ms, p95 {latency["p95"]:.1f} ms, p99 {latency["p99"]:.1f} ms, max {latency["max"]:.1f} ms')
+                show(*(f'  {bucket} ms: {count}' for bucket, count in latency['histogram'].items() if count))
+            if summary['rows'] is not None:
+                show(f'Rows: {summary["rows"]} ({summary["rows_per_s"]} per s)')
+
+
+class TQCClient:
+    '''
+    Client for TQC, holding a pooled session that is reused across requests.
+
+    If `timings` (a `Timings`) is given, the phases of requests made through the client and each HTTP request are recorded in it.
+
+    Filters are given as a dictionary of field arguments, as on the command line, e.g. `{'sequencing_org_code' : 'BIRM', 'num_bases' : ['gt', 29000]}`.
+    Values may be single values, or lists of values that are matched against separately.
+    '''
+    def __init__(self, host=None, port=None, api_key=None, workers=4, attempts=5, backoff=1.0, max_url_length=8000, timings=None):
+        if host is None:
+            host = os.getenv('TQC_IP')
+        if port is None:
+            port = os.getenv('TQC_PORT')
+        if api_key is None:
+            api_key = os.getenv('TQC_ADD_KEY')
+
+        self.url = f'http://{host}:{port}'
+        self.api_key = api_key
+        self.workers = max(workers, 1)
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_url_length = max_url_length
+        self.session = make_session(self.workers)
+        self._capabilities = None
+
+        # Record every request made through the session, if collecting timings
+        self.timings = timings
+        if timings is not None:
+            self.session.hooks['response'].append(timings.record_response)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def capabilities(self):
+        '''
+        Optional features advertised by the server, probed on first use.
+        '''
+        if self._capabilities is None:
+            self._capabilities = server_capabilities(self.url, session=self.session)
+        return self._capabilities
+
+    def filter_args(self, filters):
+        '''
+        Copy of `filters`, with each single value or operator and value pair wrapped in a list, as `make_query_params` expects.
+        '''
+        args = {}
+        for field, values in (filters or {}).items():
+            if values is None:
+                continue
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            elif field in numeric_columns() and len(values) == 2 and isinstance(values[0], str) and values[0].lower() in operators():
+                values = [values]
+            args[field] = copy.deepcopy(list(values))
+        return args
+
+    def results(self, filters=None, pag_defaults=True, columns=None, page_size=None, parallel=4, parallel_pages=4):
+        '''
+        Results of a get request, as a list of dictionaries as returned by the server.
+
+        Raises a `ResponseError` if the server responds with an error.
+        '''
+        return fetch_results(
+            self.url, 
+            self.filter_args(filters), 
+            pag_defaults=pag_defaults, 
+            max_url_length=self.max_url_length, 
+            parallel=parallel, 
+            page_size=page_size, 
+            parallel_pages=parallel_pages, 
+            attempts=self.attempts, 
+            columns=columns, 
+            session=self.session, 
+            capabilities=self.capabilities(), 
+            timings=self.timings
+        )
+
+    def iter_results(self, filters=None, pag_defaults=True, columns=None, page_size=None, parallel_pages=4):
+        '''
+        Yield the results of a get request as they are received, as dictionaries as returned by the server.
+
+        Raises a `ResponseError` if the server responds with an error.
+        '''
+        return iter_stream_results(
+            self.url, 
+            self.filter_args(filters), 
+            pag_defaults=pag_defaults, 
+            max_url_length=self.max_url_length, 
+            page_size=page_size, 
+            parallel_pages=parallel_pages, 
+            attempts=self.attempts, 
+            columns=columns, 
+            session=self.session, 
+            capabilities=self.capabilities(), 
+            timings=self.timings
+        )
+
+    def iter_rows(self, filters=None, pag_defaults=True, columns=None, page_size=None, parallel_pages=4):
+        '''
+        Yield the rows of the TQC output table as they are received, as dictionaries keyed by output column.
+        '''
+        columns = projected_columns(columns) if columns else None
+        aliases = column_aliases('get')
+        converters = cell_converters(columns)
+        for result in self.iter_results(filters, pag_defaults=pag_defaults, columns=columns, page_size=page_size, parallel_pages=parallel_pages):
+            yield result_record(result, aliases, columns=columns, converters=converters)
+
+    def iter_pages(self, filters=None, pag_defaults=True, columns=None, page_size=None, parallel=4):
+        '''
+        Yield the rows of the TQC output table a page at a time, as lists of dictionaries keyed by output column.
+
+        Pages are of `page_size` rows if the server supports pagination. Otherwise there is a page per sub-query.
+        '''
+        columns = projected_columns(columns) if columns else None
+        aliases = column_aliases('get')
+        converters = cell_converters(columns)
+        capabilities = self.capabilities()
+        request_urls = query_urls(self.url, self.filter_args(filters), capabilities, pag_defaults=pag_defaults, max_url_length=self.max_url_length, columns=columns)
+
+        # Paginate if the server supports it
+        if not capabilities.get('pagination', False):
+            page_size = None
+
+        # Sub-queries overlap if a value was given more than once
+        ids = set()
+        for page in iter_pages(self.session, request_urls, page_size=page_size, parallel=parallel, attempts=self.attempts, backoff=self.backoff, timings=self.timings):
+            rows = []
+            for result in page:
+                if result['id'] in ids:
+                    continue
+                ids.add(result['id'])
+                rows.append(result_record(result, aliases, columns=columns, converters=converters))
+            yield rows
+
+    def get(self, filters=None, pag_defaults=True, columns=None, metadata_path=None, metadata_keys=None, page_size=None, parallel=4, iterator=False):
+        '''
+        Get data from TQC as a DataFrame of the TQC output table, optionally annotated with the metadata in `metadata_path`.
+
+        If `iterator` is set, an iterator of rows is returned instead, holding no more than a page in memory at a time.
+        '''
+        columns = projected_columns(columns) if columns else None
+        if iterator:
+            if metadata_path:
+                raise Exception('Cannot annotate rows with metadata when iterating')
+            return self.iter_rows(filters, pag_defaults=pag_defaults, columns=columns, page_size=page_size, parallel_pages=parallel)
+
+        results = self.results(filters, pag_defaults=pag_defaults, columns=columns, page_size=page_size, parallel=parallel, parallel_pages=parallel)
+        return get_dataframe(results, metadata_path=metadata_path, metadata_keys=metadata_keys, columns=columns)
+
+    def add(self, records, handle=None, workers=None, batch_size=1, compress=False, attempts=None, backoff=None):
+        '''
+        Upload an iterable of records (dictionaries, with the columns of an upload TSV) to TQC, over up to the client's `workers` concurrent requests.
+
+        `handle(record, payload, ok, status)` is called as each record's response arrives, if given.
+        Returns the number of records attempted and successful, and each record that failed with its status.
+        '''
+        summary = {'attempted' : 0, 'successful' : 0, 'failed' : []}
+
+        def handle_record(record, payload, ok, status):
+            summary['attempted'] += 1
+            if ok:
+                summary['successful'] += 1
+            else:
+                summary['failed'].append((record, status))
+            if handle is not None:
+                handle(record, payload, ok, status)
+
+        def payloads():
+            for record in records:
+                # Records are copied, so that those passed in are not renamed
+                record = alias_add_record(dict(record))
+                yield record, json.dumps(record)
+
+        upload_records(
+            self.url, 
+            self.api_key, 
+            payloads(), 
+            handle_record, 
+            workers=self.workers if workers is None else min(workers, self.workers), 
+            batch_size=batch_size, 
+            compress=compress, 
+            attempts=self.attempts if attempts is None else attempts, 
+            backoff=self.backoff if backoff is None else backoff, 
+            session=self.session
+        )
+        return summary
+
+    def stats(self, filters=None, group_by=None, aggregations=None, pag_defaults=True, page_size=None, parallel_pages=4, chunk_size=50000, offline=False, replica_path=None):
+        '''
+        Aggregations over groups of the data in TQC (or the local replica, if `offline`), as a DataFrame with a row per group.
+
+        Raises a `ResponseError` if the server responds with an error.
+        '''
+        return stats_table(
+            self.url, 
+            self.filter_args(filters), 
+            group_by=group_by, 
+            aggregations=aggregations, 
+            pag_defaults=pag_defaults, 
+            max_url_length=self.max_url_length, 
+            page_size=page_size, 
+            parallel_pages=parallel_pages, 
+            attempts=self.attempts, 
+            chunk_size=chunk_size, 
+            offline=offline, 
+            replica_path=replica_path, 
+            session=self.session, 
+            capabilities=None if offline else self.capabilities(), 
+            timings=self.timings
+        )
+
+
+def add_filter_arguments(parser):
+    '''
+    Add the arguments for filtering on each field of TQC, shared by get and stats requests.
+    '''
+    parser.add_argument('--central-sample-id', default=None, nargs='+', action='append')
+    parser.add_argument('--run-name', default=None, nargs='+', action='append')
+    parser.add_argument('--pag-name', default=None, nargs='+', action='append')
+    parser.add_argument('--pag-suppressed', default=None, nargs='+', action='append', help='Default: valid PAGs only')
+    parser.add_argument('--pag-basic-qc', default=None, nargs='+', action='append', help='Default: passed PAGs only')
+    parser.add_argument('--all', default=False, action='store_true', help='Ignore defaults regarding PAG suppression and basic QC passing')
+    parser.add_argument('--sequencing-org-code', default=None, nargs='+', action='append')
+    parser.add_argument('--foel-producer', default=None, nargs='+', action='append')
+    parser.add_argument('--phe-private-provider', default=None, nargs='+', action='append')
+    parser.add_argument('--phe-site', default=None, nargs='+', action='append')
+    parser.add_argument('--collection-pillar', default=None, nargs='+', action='append')
+
+    # Currently makes more sense to keep date filtering arguments for a given field separate from the same get request
+    # As otherwise we would be doing an implicit mix of unions (between date arguments) and intersections (with every other argument) when matching rows
+    # That could get confusing
+
+    collection_date_parser = parser.add_mutually_exclusive_group()
+    collection_date_parser.add_argument('--collection-date', default=None, nargs='+', metavar=('YYYY-MM-DD'), action='append')
+    collection_date_parser.add_argument('--collection-date-range', default=None, nargs=2, metavar=('YYYY-MM-DD', 'YYYY-MM-DD'), action='append')
+    collection_date_parser.add_argument('--collection-iso-week', default=None, nargs='+', metavar=('YYYY-WW'), action='append')
+    collection_date_parser.add_argument('--collection-iso-week-range', default=None, nargs=2, metavar=('YYYY-WW', 'YYYY-WW'), action='append')
+
+    received_date_parser = parser.add_mutually_exclusive_group()
+    received_date_parser.add_argument('--received-date', default=None, nargs='+', metavar=('YYYY-MM-DD'), action='append')
+    received_date_parser.add_argument('--received-date-range', default=None, nargs=2, metavar=('YYYY-MM-DD', 'YYYY-MM-DD'), action='append')
+    received_date_parser.add_argument('--received-iso-week', default=None, nargs='+', metavar=('YYYY-WW'), action='append')
+    received_date_parser.add_argument('--received-iso-week-range', default=None, nargs=2, metavar=('YYYY-WW', 'YYYY-WW'), action='append')
+
+    sequencing_org_received_date_parser = parser.add_mutually_exclusive_group()
+    sequencing_org_received_date_parser.add_argument('--sequencing-org-received-date', default=None, nargs='+', metavar=('YYYY-MM-DD'), action='append')
+    sequencing_org_received_date_parser.add_argument('--sequencing-org-received-date-range', default=None, nargs=2, metavar=('YYYY-MM-DD', 'YYYY-MM-DD'), action='append')
+    sequencing_org_received_date_parser.add_argument('--sequencing-org-received-iso-week', default=None, nargs='+', metavar=('YYYY-WW'), action='append')
+    sequencing_org_received_date_parser.add_argument('--sequencing-org-received-iso-week-range', default=None, nargs=2, metavar=('YYYY-WW', 'YYYY-WW'), action='append')
+
+    sequencing_submission_date_parser = parser.add_mutually_exclusive_group()
+    sequencing_submission_date_parser.add_argument('--sequencing-submission-date', default=None, nargs='+', metavar=('YYYY-MM-DD'), action='append')
+    sequencing_submission_date_parser.add_argument('--sequencing-submission-date-range', default=None, nargs=2, metavar=('YYYY-MM-DD', 'YYYY-MM-DD'), action='append')
+    sequencing_submission_date_parser.add_argument('--sequencing-submission-iso-week', default=None, nargs='+', metavar=('YYYY-WW'), action='append')
+    sequencing_submission_date_parser.add_argument('--sequencing-submission-iso-week-range', default=None, nargs=2, metavar=('YYYY-WW', 'YYYY-WW'), action='append')
+
+    published_date_parser = parser.add_mutually_exclusive_group()
+    published_date_parser.add_argument('--published-date', default=None, nargs='+', metavar=('YYYY-MM-DD'), action='append')
+    published_date_parser.add_argument('--published-date-range', default=None, nargs=2, metavar=('YYYY-MM-DD', 'YYYY-MM-DD'), action='append')
+    published_date_parser.add_argument('--published-iso-week', default=None, nargs='+', metavar=('YYYY-WW'), action='append')
+    published_date_parser.add_argument('--published-iso-week-range', default=None, nargs=2, metavar=('YYYY-WW', 'YYYY-WW'), action='append')
+
+    parser.add_argument('--fasta-path', default=None, nargs='+', action='append')
+    parser.add_argument('--bam-path', default=None, nargs='+', action='append')
+    parser.add_argument('--library-primers', default=None, nargs='+', action='append')
+    parser.add_argument('--library-primers-reported', default=None, nargs='+', action='append')
+
+    # FASTA QC
+    parser.add_argument('--num-bases', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-acgt', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-masked', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-invalid', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-ambiguous', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--longest-gap', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--longest-ungap', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+
+    # BAM QC
+    parser.add_argument('--num-pos', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--mean-cov', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-pos-cov-gte1', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-pos-cov-gte5', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-pos-cov-gte10', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-pos-cov-gte20', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-pos-cov-gte50', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-pos-cov-gte100', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-pos-cov-gte200', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-tiles-medcov-gte1', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-tiles-medcov-gte5', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-tiles-medcov-gte10', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-tiles-medcov-gte20', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-tiles-medcov-gte50', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-tiles-medcov-gte100', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--pc-tiles-medcov-gte200', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+    parser.add_argument('--tile-n', default=None, nargs=2, metavar=('OPERATOR', 'VALUE'), action='append')
+
+
+def add_timing_arguments(parser):
+    '''
+    Add the arguments for reporting timings, shared by requests that contact TQC.
+    '''
+    parser.add_argument('--timings', default=False, action='store_true', help='Print the time spent in each phase, and the latencies and sizes of requests, to stderr')
+    parser.add_argument('--timings-json', default=None, metavar=('PATH'), help='Write the timings to PATH as JSON')
+
+
+def positive_int(value):
+    '''
+    Argument type for counts that must be at least one.
+    '''
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1, not {number}')
+    return number
+
+
+def field_arguments(args, non_field_args):
+    '''
+    Field related arguments of a get or stats request, after removing those named in `non_field_args`.
+    '''
+    arguments = dict(args.__dict__)
+
+    # Remove non-field related arguments
+    for x in non_field_args:
+        arguments.pop(x)
+
+    # Names of numeric TQC columns 
+    numeric_args = numeric_columns()
+
+    # Reject non-numeric arguments passed multiple times
+    # Outer list for non-numeric arguments is then removed
+    # This enables checks for multiple of the same --arg calls
+    # Having them silently overwrite is not preferable and has been avoided
+    for key, value in arguments.items(): 
+        if not (key in numeric_args) and isinstance(value, list):
+            if len(value) > 1:
+                raise Exception('Cannnot pass the same argument multiple times')
+            arguments[key] = value[0]
+
+    return arguments
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    request_parsers = parser.add_subparsers(dest='request_type', required=True)
+    
+    # Add request
+    add_parser = request_parsers.add_parser('add', allow_abbrev=False)
+    add_parser.add_argument('tsv_path', metavar=('TSV_PATH'))
+
+    add_parser.add_argument('--hide-uploads', default=False, action='store_true')
+    add_parser.add_argument('--workers', default=1, type=positive_int, metavar=('N'), help='Number of concurrent uploads. Default: 1')
+    add_parser.add_argument('--batch-size', default=1, type=positive_int, metavar=('N'), help='Number of records sent per bulk upload. Default: 1 (no bulk uploads)')
+    add_parser.add_argument('--gzip', default=False, action='store_true', help='Compress bulk uploads with gzip')
+    add_parser.add_argument('--resume', default=False, action='store_true', help='Skip records acknowledged by a previous, interrupted upload of the same TSV')
+    add_parser.add_argument('--journal', default=None, metavar=('PATH'), help="Checkpoint journal for --resume. Default: derived from TSV_PATH (required if it is '-')")
+    add_parser.add_argument('--incremental', default=False, action='store_true', help='Skip records that are unchanged since they were last uploaded with --incremental')
+    add_parser.add_argument('--index', default=None, metavar=('PATH'), help='Local index of uploaded records. Default: $EAGLEOWL_SCRATCH/tqc/index.sqlite')
+    add_timing_arguments(add_parser)
+    add_parser.add_argument('--host', default=os.getenv('TQC_IP'))
+    add_parser.add_argument('--port', default=os.getenv('TQC_PORT'))
+    add_parser.add_argument('--api-key', default=os.getenv('TQC_ADD_KEY'))
+
+    # Retry request
+    retry_parser = request_parsers.add_parser('retry', allow_abbrev=False, description='Replay the records in a failures log')
+    retry_parser.add_argument('--log', default=None, metavar=('PATH'), help='Default: $EAGLEOWL_SCRATCH/tqc/failures.log')
+    retry_parser.add_argument('--hide-uploads', default=False, action='store_true')
+    retry_parser.add_argument('--workers', default=1, type=positive_int, metavar=('N'), help='Number of concurrent uploads. Default: 1')
+    retry_parser.add_argument('--batch-size', default=1, type=positive_int, metavar=('N'), help='Number of records sent per bulk upload. Default: 1 (no bulk uploads)')
+    retry_parser.add_argument('--gzip', default=False, action='store_true', help='Compress bulk uploads with gzip')
+    retry_parser.add_argument('--attempts', default=5, type=positive_int, metavar=('N'), help='Maximum attempts per upload. Default: 5')
+    retry_parser.add_argument('--backoff', default=1.0, type=float, metavar=('SECONDS'), help='Delay before the first retry, doubled for each one after. Default: 1')
+    retry_parser.add_argument('--incremental', default=False, action='store_true', help='Record replayed records in the index used by add --incremental')
+    retry_parser.add_argument('--index', default=None, metavar=('PATH'), help='Local index of uploaded records. Default: $EAGLEOWL_SCRATCH/tqc/index.sqlite')
+    add_timing_arguments(retry_parser)
+    retry_parser.add_argument('--host', default=os.getenv('TQC_IP'))
+    retry_parser.add_argument('--port', default=os.getenv('TQC_PORT'))
+    retry_parser.add_argument('--api-key', default=os.getenv('TQC_ADD_KEY'))
+
+    # Index request
+    index_parser = request_parsers.add_parser('index', allow_abbrev=False, description='Manage the local index of uploaded records used by add --incremental')
+    index_parsers = index_parser.add_subparsers(dest='index_command', required=True)
+    index_rebuild_parser = index_parsers.add_parser('rebuild', allow_abbrev=False, description='Replace the index with the records in previously uploaded TSVs')
+    index_rebuild_parser.add_argument('tsv_paths', nargs='+', metavar=('TSV_PATH'))
+    index_info_parser = index_parsers.add_parser('info', allow_abbrev=False, description='Summarise the index')
+    index_dump_parser = index_parsers.add_parser('dump', allow_abbrev=False, description='Print the index as a TSV')
+    for p in [index_rebuild_parser, index_info_parser, index_dump_parser]:
+        p.add_argument('--index', default=None, metavar=('PATH'), help='Default: $EAGLEOWL_SCRATCH/tqc/index.sqlite')
+    
+    # Get request
+    get_parser = request_parsers.add_parser('get', allow_abbrev=False, description='operators: lt, gt, leq, geq, eq, neq')
+    add_filter_arguments(get_parser)
+    get_parser.add_argument('--ids-from', default=None, metavar=('FILE'), help="Read central_sample_ids from FILE (or stdin, if '-'), one per line")
+
+    get_parser.add_argument('--metadata', default=None, metavar=('TSV_PATH'), help='Annotate the output with a metadata TSV, which may be gzipped')
+    get_parser.add_argument('--metadata-key', default=None, nargs='+', metavar=('COLUMN'), help='Columns to join the metadata on. Default: all columns it shares with the output')
+    get_parser.add_argument('--stream', default=False, action='store_true', help='Write rows as they are received, using constant memory')
+    get_parser.add_argument('--follow', default=False, action='store_true', help='Keep polling for new data, writing only rows that are new or have changed since they were last written')
+    get_parser.add_argument('--interval', default=60.0, type=float, metavar=('SECONDS'), help='Time between polls with --follow. Default: 60')
+    get_parser.add_argument('--polls', default=None, type=positive_int, metavar=('N'), help='Stop after N polls with --follow. Default: poll until interrupted')
+    get_parser.add_argument('--state', default=None, metavar=('PATH'), help='State kept between polls by --follow. Default: follow.sqlite in the cache directory')
+    get_parser.add_argument('--max-url-length', default=8000, type=int, metavar=('N'), help='Split queries with longer URLs into sub-queries. Default: 8000')
+    get_parser.add_argument('--parallel', default=4, type=positive_int, metavar=('N'), help='Number of sub-queries run concurrently. Default: 4')
+    get_parser.add_argument('--page-size', default=None, type=positive_int, metavar=('N'), help='Fetch results in pages of N rows, if the server supports it')
+    get_parser.add_argument('--parallel-pages', default=4, type=positive_int, metavar=('N'), help='Number of pages fetched concurrently. Default: 4')
+    get_parser.add_argument('--attempts', default=5, type=positive_int, metavar=('N'), help='Maximum attempts per page. Default: 5')
+    get_parser.add_argument('--no-cache', default=False, action='store_true', help='Do not read or write cached results')
+    get_parser.add_argument('--refresh', default=False, action='store_true', help='Ignore cached results, and cache the new ones')
+    get_parser.add_argument('--cache-dir', default=None, metavar=('PATH'), help='Default: $TQC_CACHE_DIR, $EAGLEOWL_SCRATCH/tqc/cache or ~/.cache/tqc')
+    get_parser.add_argument('--cache-ttl', default=3600, type=int, metavar=('SECONDS'), help="How long results are cached for. Default: 3600 (300 for queries on 'today')")
+    get_parser.add_argument('--cache-size', default=1024, type=int, metavar=('MB'), help='Maximum size of the cache. Default: 1024')
+    get_parser.add_argument('--offline', default=False, action='store_true', help="Get data from the local replica kept up to date by 'tqc.py sync', instead of from TQC")
+    get_parser.add_argument('--replica', default=None, metavar=('PATH'), help='Local replica used by --offline. Default: replica.sqlite in the cache directory')
+    get_parser.add_argument('--format', default='tsv', choices=output_formats(), help='Output format. parquet, arrow and feather require pyarrow. Default: tsv')
+    get_parser.add_argument('--output', default=None, metavar=('PATH'), help='Write output to PATH. Default: stdout')
+    get_parser.add_argument('--columns', default=None, nargs='+', metavar=('COLUMN'), help='Only return these columns, in this order')
+
+    add_timing_arguments(get_parser)
     get_parser.add_argument('--host', default=os.getenv('TQC_IP'))
     get_parser.add_argument('--port', default=os.getenv('TQC_PORT'))
 
+    # Stats request
+    stats_parser = request_parsers.add_parser('stats', allow_abbrev=False, description='Aggregate the data in TQC. operators: lt, gt, leq, geq, eq, neq')
+    add_filter_arguments(stats_parser)
+    stats_parser.add_argument('--group-by', default=None, nargs='+', metavar=('COLUMN'), help='Columns to group by, including ISO weeks of dates (e.g. published_iso_week)')
+    stats_parser.add_argument('--agg', default=None, nargs='+', metavar=('AGGREGATION'), help='count, FUNC:COLUMN (FUNC is mean, sum, min, max, std, median or qN) or rate:COLUMN=VALUE. Default: count')
+    stats_parser.add_argument('--chunk-size', default=50000, type=positive_int, metavar=('N'), help='Number of rows aggregated at a time, when the server cannot aggregate. Default: 50000')
+    stats_parser.add_argument('--max-url-length', default=8000, type=int, metavar=('N'), help='Split queries with longer URLs into sub-queries. Default: 8000')
+    stats_parser.add_argument('--page-size', default=None, type=positive_int, metavar=('N'), help='Fetch results in pages of N rows, if the server supports it')
+    stats_parser.add_argument('--parallel-pages', default=4, type=positive_int, metavar=('N'), help='Number of pages fetched concurrently. Default: 4')
+    stats_parser.add_argument('--attempts', default=5, type=positive_int, metavar=('N'), help='Maximum attempts per page. Default: 5')
+    stats_parser.add_argument('--offline', default=False, action='store_true', help="Aggregate the local replica kept up to date by 'tqc.py sync', instead of TQC")
+    stats_parser.add_argument('--replica', default=None, metavar=('PATH'), help='Local replica used by --offline. Default: replica.sqlite in the cache directory')
+    stats_parser.add_argument('--format', default='tsv', choices=output_formats(), help='Output format. parquet, arrow and feather require pyarrow. Default: tsv')
+    stats_parser.add_argument('--output', default=None, metavar=('PATH'), help='Write output to PATH. Default: stdout')
+    add_timing_arguments(stats_parser)
+    stats_parser.add_argument('--host', default=os.getenv('TQC_IP'))
+    stats_parser.add_argument('--port', default=os.getenv('TQC_PORT'))
+
+    # Sync request
+    sync_parser = request_parsers.add_parser('sync', allow_abbrev=False, description='Update the local replica of TQC used by get --offline')
+    sync_parser.add_argument('--replica', default=None, metavar=('PATH'), help='Default: replica.sqlite in the cache directory')
+    sync_parser.add_argument('--full', default=False, action='store_true', help='Pull everything again, rather than only the days since the last sync')
+    sync_parser.add_argument('--page-size', default=None, type=positive_int, metavar=('N'), help='Fetch results in pages of N rows, if the server supports it')
+    sync_parser.add_argument('--parallel-pages', default=4, type=positive_int, metavar=('N'), help='Number of pages fetched concurrently. Default: 4')
+    sync_parser.add_argument('--attempts', default=5, type=positive_int, metavar=('N'), help='Maximum attempts per page. Default: 5')
+    add_timing_arguments(sync_parser)
+    sync_parser.add_argument('--host', default=os.getenv('TQC_IP'))
+    sync_parser.add_argument('--port', default=os.getenv('TQC_PORT'))
+
+    # Tiles request
+    tiles_parser = request_parsers.add_parser('tiles', allow_abbrev=False, description='Summarise amplicon dropouts from the tile_vector column of get output')
+    tiles_parser.add_argument('input_path', metavar=('TSV_PATH'), help="Output of get (or '-' to read it from stdin)")
+    tiles_parser.add_argument('--output-dir', default='tiles', metavar=('PATH'), help='Directory to write matrices and summaries to. Default: tiles')
+    tiles_parser.add_argument('--threshold', default=20.0, type=float, metavar=('COVERAGE'), help='Tiles with a lower median coverage have dropped out. Default: 20')
+
+    # Cache request
+    cache_parser = request_parsers.add_parser('cache', allow_abbrev=False, description='Manage the cache of get results')
+    cache_parsers = cache_parser.add_subparsers(dest='cache_command', required=True)
+    cache_stats_parser = cache_parsers.add_parser('stats', allow_abbrev=False, description='Summarise the cache and its hit rate')
+    cache_clear_parser = cache_parsers.add_parser('clear', allow_abbrev=False, description='Remove all cached results and statistics')
+    for p in [cache_stats_parser, cache_clear_parser]:
+        p.add_argument('--cache-dir', default=None, metavar=('PATH'), help='Default: $TQC_CACHE_DIR, $EAGLEOWL_SCRATCH/tqc/cache or ~/.cache/tqc')
+
     # Parse arguments
     args = parser.parse_args()
 
-    url = f'http://{args.host}:{args.port}'
+    # The cache is local, so needs no connection to TQC
+    if args.request_type == 'cache':
+        if args.cache_command == 'stats':
+            cache_stats(cache_dir=args.cache_dir)
+        elif args.cache_command == 'clear':
+            clear_cache(cache_dir=args.cache_dir)
+        return
+
+    # Tile analysis works on output that has already been fetched, so needs no connection to TQC
+    if args.request_type == 'tiles':
+        tiles(args.input_path, output_dir=args.output_dir, threshold=args.threshold)
+        return
+
+    # The index is local, so needs no connection to TQC
+    if args.request_type == 'index':
+        if args.index_command == 'rebuild':
+            rebuild_index(args.tsv_paths, index_path=args.index)
+        elif args.index_command == 'info':
+            index_info(index_path=args.index)
+        elif args.index_command == 'dump':
+            dump_index(index_path=args.index)
+        return
+
+    print_timings = args.timings
+    timings_json = args.timings_json
+    timings = Timings(command=args.request_type) if print_timings or timings_json else None
+
+    # A single client, with a connection pool large enough for the most concurrent requests that will be made
+    client = TQCClient(
+        host=args.host, 
+        port=args.port, 
+        api_key=getattr(args, 'api_key', None), 
+        workers=max(getattr(args, x, 1) for x in ['workers', 'parallel', 'parallel_pages']), 
+        attempts=getattr(args, 'attempts', 5), 
+        max_url_length=getattr(args, 'max_url_length', 8000), 
+        timings=timings
+    )
 
+    try:
+        run(client, args)
+    finally:
+        client.close()
+        if timings is not None:
+            timings.report(print_timings=print_timings, json_path=timings_json)
+
+
+def run(client, args):
+    '''
+    Run a request that contacts TQC (or reads its local replica) through `client`.
+    '''
     if args.request_type == 'add':
-        add(url, args.api_key, args.tsv_path, print_uploads=not args.hide_uploads)
+        add(client, args.tsv_path, print_uploads=not args.hide_uploads, workers=args.workers, batch_size=args.batch_size, compress=args.gzip, resume=args.resume, journal=args.journal, incremental=args.incremental, index_path=args.index)
+
+    elif args.request_type == 'retry':
+        retry(
+            client, 
+            log_path=args.log, 
+            print_uploads=not args.hide_uploads, 
+            workers=args.workers, 
+            batch_size=args.batch_size, 
+            compress=args.gzip, 
+            attempts=args.attempts, 
+            backoff=args.backoff,
+            incremental=args.incremental,
+            index_path=args.index
+        )
+
+    elif args.request_type == 'sync':
+        sync(client, replica_path=args.replica, full=args.full, page_size=args.page_size, parallel_pages=args.parallel_pages)
+
+    elif args.request_type == 'stats':
+        arguments = field_arguments(args, [
+            'request_type', 
+            'group_by', 
+            'agg', 
+            'chunk_size', 
+            'max_url_length', 
+            'page_size', 
+            'parallel_pages', 
+            'attempts', 
+            'offline', 
+            'replica', 
+            'format', 
+            'output', 
+            'timings', 
+            'timings_json', 
+            'host', 
+            'port', 
+            'all'
+        ])
+        if args.format in binary_formats():
+            import_pyarrow(args.format)
+
+        stats(
+            client, 
+            arguments, 
+            group_by=args.group_by, 
+            aggregations=args.agg, 
+            pag_defaults=not args.all, 
+            page_size=args.page_size, 
+            parallel_pages=args.parallel_pages, 
+            chunk_size=args.chunk_size, 
+            offline=args.offline, 
+            replica_path=args.replica, 
+            output_format=args.format, 
+            output_path=args.output
+        )
 
     elif args.request_type == 'get':
-        arguments = dict(args.__dict__)
-
-        # Remove non-field related arguments
-        arguments.pop('request_type')
-        arguments.pop('metadata')
-        arguments.pop('host')
-        arguments.pop('port')
-        arguments.pop('all')
-
-        # Names of numeric TQC columns 
-        numeric_args = numeric_columns()
-
-        # Reject non-numeric arguments passed multiple times
-        # Outer list for non-numeric arguments is then removed
-        # This enables checks for multiple of the same --arg calls
-        # Having them silently overwrite is not preferable and has been avoided
-        for key, value in arguments.items(): 
-            if not (key in numeric_args) and isinstance(value, list):
-                if len(value) > 1:
-                    raise Exception('Cannnot pass the same argument multiple times')
-                arguments[key] = value[0]
-
-        get(url, arguments, metadata_path=args.metadata, pag_defaults=not args.all)
+        arguments = field_arguments(args, [
+            'request_type', 
+            'metadata', 
+            'metadata_key', 
+            'ids_from', 
+            'stream', 
+            'follow', 
+            'interval', 
+            'polls', 
+            'state', 
+            'max_url_length', 
+            'parallel', 
+            'page_size', 
+            'parallel_pages', 
+            'attempts', 
+            'no_cache', 
+            'refresh', 
+            'cache_dir', 
+            'cache_ttl', 
+            'cache_size', 
+            'offline', 
+            'replica', 
+            'format', 
+            'output', 
+            'columns', 
+            'timings', 
+            'timings_json', 
+            'host', 
+            'port', 
+            'all'
+        ])
+
+        # Reject unknown columns and unavailable formats before any requests are made
+        columns = projected_columns(args.columns) if args.columns else None
+        if args.format in binary_formats():
+            import_pyarrow(args.format)
+
+        if args.follow:
+            for x in ['metadata', 'ids_from', 'page_size', 'offline']:
+                if getattr(args, x):
+                    raise Exception(f"Cannot pass --{x.replace('_', '-')} with --follow")
+            follow(
+                client, 
+                arguments, 
+                pag_defaults=not args.all, 
+                columns=columns, 
+                output_format=args.format, 
+                output_path=args.output, 
+                interval=args.interval, 
+                polls=args.polls, 
+                state_path=args.state
+            )
+        elif args.offline:
+            for x in ['ids_from', 'stream']:
+                if getattr(args, x):
+                    raise Exception(f"Cannot pass --{x.replace('_', '-')} with --offline")
+            get_offline(
+                arguments, 
+                replica_path=args.replica, 
+                metadata_path=args.metadata, 
+                pag_defaults=not args.all, 
+                metadata_keys=args.metadata_key, 
+                columns=columns, 
+                output_format=args.format, 
+                output_path=args.output, 
+                timings=client.timings
+            )
+        elif args.ids_from:
+            if arguments.get('central_sample_id'):
+                raise Exception('Cannot pass both --central-sample-id and --ids-from')
+            get_ids(
+                client, 
+                arguments, 
+                args.ids_from, 
+                metadata_path=args.metadata, 
+                pag_defaults=not args.all, 
+                parallel=args.parallel, 
+                metadata_keys=args.metadata_key, 
+                columns=columns, 
+                output_format=args.format, 
+                output_path=args.output
+            )
+        elif args.stream:
+            get_stream(
+                client, 
+                arguments, 
+                metadata_path=args.metadata, 
+                pag_defaults=not args.all, 
+                page_size=args.page_size, 
+                parallel_pages=args.parallel_pages, 
+                metadata_keys=args.metadata_key,
+                columns=columns,
+                output_format=args.format,
+                output_path=args.output
+            )
+        else:
+            get(
+                client, 
+                arguments, 
+                metadata_path=args.metadata, 
+                pag_defaults=not args.all, 
+                parallel=args.parallel, 
+                page_size=args.page_size, 
+                parallel_pages=args.parallel_pages, 
+                use_cache=not args.no_cache,
+                refresh=args.refresh,
+                cache_dir=args.cache_dir,
+                ttl=args.cache_ttl,
+                max_cache_size=args.cache_size * 1024 ** 2,
+                metadata_keys=args.metadata_key,
+                columns=columns,
+                output_format=args.format,
+                output_path=args.output
+            )
 
 
 if __name__ == '__main__':